@@ -5,14 +5,25 @@ from astrbot.api import AstrBotConfig
 import random
 import json
 import os
+import sys
 import errno
+import contextlib
+import functools
+import io
 import shutil
+import string
 import tempfile
+import threading
+import time
+import traceback
+import types
+from collections import Counter
 from pathlib import Path
 from hashlib import sha256
 from urllib.parse import urlparse
+from urllib.request import url2pathname
 from uuid import uuid4
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Dict, Any
 from PIL import Image, ImageDraw, ImageFont
 import aiohttp
 from datetime import datetime
@@ -20,12 +31,18 @@ import asyncio
 import aiofiles
 import aiofiles.os
 
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，使用锁文件
+    fcntl = None
+
 
 ONE_DAY_IN_SECONDS = 86400
 IMAGE_HEIGHT = 1920
 IMAGE_WIDTH = 1080
 AVATAR_SIZE = (150, 150)
 AVATAR_POSITION = (60, 1350)
+AVATAR_URL = "http://q.qlogo.cn/g?b=qq&nk={user_id}&s=640"
 FONT_NAME = "千图马克手写体.ttf"
 
 TEXT_BOX_Y = 1270
@@ -45,6 +62,592 @@ TEXT_WRAP_WIDTH = 1000
 
 LEFT_PADDING = 20
 
+# 缩放渲染：整个排版（位置、字号、头像）按比例缩小，直接输出小尺寸海报
+RENDER_SCALE_MIN = 0.25
+
+# 缓存统计：各缓存共用同一组计数字段
+# avatar 头像 / background 背景图原件 / normalized 裁剪后的背景图 / sprite 固定文字层 / date_layer 日期图层
+# evictions 只统计持久缓存条目被移除，一次性临时下载（background_images_tmp）的删除不计入
+CACHE_STAT_NAMES = ("avatar", "background", "normalized", "sprite", "date_layer")
+CACHE_STAT_FIELDS = (
+    "hits",
+    "misses",
+    "stale",
+    "download_bytes",
+    "download_failures",
+    "evictions",
+    "deduped",
+)
+CACHE_STATS_LOG_INTERVAL = 600
+
+# 事件循环延迟监控
+LOOP_LAG_SAMPLE_INTERVAL = 0.1  # 采样间隔（秒）
+LOOP_LAG_THRESHOLD_MS = 200
+LOOP_LAG_STACK_DEPTH = 12
+
+# HTTP 连接池
+HTTP_CONNECTION_LIMIT = 10  # 连接池总连接数
+HTTP_DNS_CACHE_TTL = 300  # DNS 缓存时间（秒）
+HTTP_KEEPALIVE_TIMEOUT = 30  # 空闲连接保持时间（秒）
+HTTP_HOST_LIMITS = ("qlogo.cn=4", "hdslb.com=6")  # 按域名的并发限制
+AVATAR_TIMEOUT = (3, 5)  # 头像 [连接超时, 读取超时]（秒）
+BACKGROUND_TIMEOUT = (5, 20)  # 背景图 [连接超时, 读取超时]（秒）
+HTTP_STAT_FIELDS = (
+    "requests",
+    "connections_created",
+    "connections_reused",
+    "connections_queued",
+    "dns_cache_hits",
+    "dns_cache_misses",
+)
+
+# 下载校验
+AVATAR_MAX_SIZE_KB = 2048
+BACKGROUND_MAX_SIZE_KB = 20480
+DEFAULT_MAX_DOWNLOAD_BYTES = BACKGROUND_MAX_SIZE_KB * 1024
+ALLOWED_BINARY_CONTENT_TYPES = {"application/octet-stream", "binary/octet-stream"}
+IMAGE_SNIFF_BYTES = 16
+
+# 背景图去重
+BACKGROUND_INDEX_FILE = "background_index.json"  # 缓存文件名 -> {url, sha256}
+BACKGROUND_DUPLICATE_REPORT = "background_duplicates.txt"
+PHASH_MAX_DISTANCE = 6  # 感知哈希汉明距离不超过该值视为疑似重复
+# 裁剪结果无损保存（PNG 低压缩级别），从缓存渲染与直接裁剪原图的结果完全一致
+NORMALIZED_PNG_COMPRESS_LEVEL = 1
+# 原图任一边超过画布的该倍数时先缩小再裁剪（crop_center），只有这类图片缓存裁剪结果：
+# 不需要缩放的图片直接解码裁剪比读取 PNG 更快，缓存只会多占磁盘
+CROP_MAX_SCALE = 1.8
+NORMALIZED_MAX_IDLE_DAYS = 14  # 裁剪结果超过该天数未被使用时清理（每次使用会刷新修改时间）
+
+LEGACY_MIGRATION_MARKER = ".legacy_migrated"  # 旧缓存目录迁移完成标记
+
+# 多实例共享缓存目录时的跨进程锁
+CACHE_LOCK_STRIPES = 256  # 锁文件按键哈希分桶，避免每个头像/背景图各建一个锁文件
+CACHE_LOCK_TIMEOUT = 60  # 等待锁的最长时间（秒），超时后不加锁继续（写入本身仍是原子的）
+CACHE_LOCK_STALE = 120  # 锁文件超过该时间未释放视为残留（进程崩溃），仅锁文件模式使用
+CACHE_LOCK_POLL_INTERVAL = 0.05  # 等待锁时的首次重试间隔（秒），之后翻倍
+CACHE_LOCK_POLL_MAX = 0.5  # 重试间隔上限（秒）
+
+# /jrys_last 原图保留策略：临时下载的原图按时间与总大小清理，长期不活跃用户的记录一并移除
+LAST_IMAGE_RETENTION_HOURS = 72
+LAST_IMAGE_MAX_TOTAL_MB = 256
+LAST_IMAGE_RECORD_DAYS = 30
+LAST_IMAGE_SWEEP_INTERVAL = 600  # 秒
+
+# 头像预热：启动后在空闲时逐个刷新最近活跃用户的头像
+AVATAR_WARMUP_DELAY = 10  # 启动后延迟开始（秒）
+AVATAR_WARMUP_INTERVAL = 0.5  # 两次下载之间的间隔（秒），有用户请求进行中时等待
+
+# 临时文件清理：中断的下载（*.tmp）、崩溃残留的渲染结果与无人引用的 background_images_tmp
+JANITOR_INTERVAL = 3600  # 秒
+JANITOR_STARTUP_DELAY = 30  # 启动后延迟首次清理，避开插件加载
+JANITOR_MIN_AGE = 3600  # 修改时间早于该秒数的临时文件才视为残留
+JANITOR_MAX_SCAN = 5000  # 每轮最多检查的目录项数
+RENDER_TEMP_PREFIX = "jrys_render_"  # 渲染结果临时文件前缀（系统临时目录）
+
+# 本地背景图：backgroundFolder 下的子目录（及其中直接放置的图片）按以下扩展名收录
+LOCAL_BACKGROUND_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif")
+LOCAL_BACKGROUND_ROOT_KEY = "./"  # backgroundFolder 根目录下图片在背景图列表中的键
+
+# 热重载：轮询 jrys.json 与 backgroundFolder/*.txt 的修改时间与大小
+HOT_RELOAD_INTERVAL = 10
+
+# 按需性能分析（/jrys_profile）
+PROFILE_MAX_REQUESTS = 50
+PROFILE_REPORT_TOP_N = 30
+PROFILE_TRACEMALLOC_FRAMES = 10
+PROFILE_TIMEOUT = 30 * 60  # 秒，超时未凑满请求数时提前结束，避免 tracemalloc 一直开着
+
+RANK_TOP_N = 10  # 运势排行显示前N名
+
+# 运势排版：后台逐条排版，有用户请求进行中时等待
+CORPUS_LAYOUT_WAIT = 0.2  # 秒
+
+# 批量渲染（/jrys_batch 与 render_batch）
+BATCH_MAX_USERS = 50
+BATCH_BACKGROUNDS = 3  # 一批最多使用的背景图数量，同一背景图只解码、裁剪一次
+BATCH_RENDER_CONCURRENCY = 2  # 同时渲染的海报数（线程池中）
+
+FONT_SIZES = (50, 60, 36, 30)  # 默认排版用到的字体大小
+FONT_LAYOUT_ENGINES = {
+    "basic": ImageFont.Layout.BASIC,
+    "raqm": ImageFont.Layout.RAQM,
+}
+
+WARNING_TEXT = "仅供娱乐 | 相信科学 | 请勿迷信"
+DATE_LAYER_VARIANTS = 8  # 日期图层的配色变体数量
+FONT_SUBSET_VERSION = 1
+FONT_SUBSET_MIN_SAVING = 0.9  # 子集不小于原字体的 90% 时不使用子集
+# 除语料外，子集字体额外保留的字符（日期数字、ASCII 标点等）
+FONT_SUBSET_EXTRA_CHARS = string.digits + string.punctuation + " " + WARNING_TEXT
+COMPILED_CORPUS_VERSION = 3  # 排版缓存格式或排版规则变化时递增，使磁盘缓存失效
+
+# 进程内共享的字体数据（插件重载后模块会被重新导入，因此挂在 sys.modules 上保留）
+_SHARED_STATE_MODULE = "astrbot_plugin_jrys_shared_state"
+_shared_state = sys.modules.get(_SHARED_STATE_MODULE)
+if _shared_state is None:
+    _shared_state = types.ModuleType(_SHARED_STATE_MODULE)
+    _shared_state.lock = threading.Lock()
+    _shared_state.font_bytes = {}  # {(路径, 大小, mtime_ns): bytes}
+    _shared_state.fonts = {}  # {(路径, mtime_ns, 字号, 排版引擎): FreeTypeFont}
+    sys.modules[_SHARED_STATE_MODULE] = _shared_state
+
+
+class FontRegistry:
+    """
+    字体注册表：字体文件只读入内存一次，各字号在首次使用时创建，
+    同一进程内（包括插件重载后）共享同一份字体数据与字体对象。
+    """
+
+    def __init__(self, font_path: str, layout_engine: Optional[Any] = None):
+        self.font_path = font_path
+        self.layout_engine = layout_engine
+
+    def _read_font_bytes(self) -> Tuple[bytes, int]:
+        st = os.stat(self.font_path)
+        key = (self.font_path, st.st_size, st.st_mtime_ns)
+        data = _shared_state.font_bytes.get(key)
+        if data is None:
+            with open(self.font_path, "rb") as f:
+                data = f.read()
+            # 字体文件更新后，旧版本的数据不再需要
+            for old_key in [k for k in _shared_state.font_bytes if k[0] == self.font_path]:
+                del _shared_state.font_bytes[old_key]
+            _shared_state.font_bytes[key] = data
+        return data, st.st_mtime_ns
+
+    def get(self, size: int) -> ImageFont.FreeTypeFont:
+        with _shared_state.lock:
+            data, mtime_ns = self._read_font_bytes()
+            key = (self.font_path, mtime_ns, size, self.layout_engine)
+            font = _shared_state.fonts.get(key)
+            if font is None:
+                # BytesIO 读取整段内容时返回同一个 bytes 对象，各字号共享一份字体数据
+                font = ImageFont.truetype(
+                    io.BytesIO(data), size, layout_engine=self.layout_engine
+                )
+                _shared_state.fonts[key] = font
+            return font
+
+    @staticmethod
+    def evict_dir(font_dir: Path, keep: Optional[str] = None) -> None:
+        """移除 font_dir 下（keep 以外）字体文件的共享数据与字体对象，用于被替换的子集字体"""
+        with _shared_state.lock:
+            for table in (_shared_state.font_bytes, _shared_state.fonts):
+                for key in [k for k in table if k[0] != keep and Path(k[0]).parent == font_dir]:
+                    del table[key]
+
+
+class FontMap(dict):
+    """按字号懒加载字体的映射（self.fonts[size]），加载失败时回退到默认字体。"""
+
+    def __init__(self, registry: FontRegistry):
+        super().__init__()
+        self.registry = registry
+
+    def __missing__(self, size: int):
+        try:
+            font = self.registry.get(size)
+        except Exception:
+            logger.error(f"无法加载字体文件 {self.registry.font_path},使用默认字体回退")
+            try:
+                font = ImageFont.load_default(size)
+            except TypeError:
+                font = ImageFont.load_default()
+        self[size] = font
+        return font
+
+
+class CacheLock:
+    """
+    跨进程文件锁
+    POSIX（Linux/macOS）使用 fcntl.flock，进程退出或崩溃时由系统释放；flock 在 NFS/SMB 等网络文件系统上不可靠，
+    共享缓存目录应放在本地磁盘。
+    Windows 没有 fcntl，改为 O_EXCL 创建锁文件：进程崩溃时锁文件会留下，其它进程要等它超过 stale_after 秒
+    才会回收，期间等待满 CACHE_LOCK_TIMEOUT 后不加锁继续。
+    拿不到锁只会造成重复下载/重复裁剪，缓存写入始终是临时文件加 os.replace，不会出现写了一半的文件
+    （tools/shared_cache_check.py 多进程检查）。
+    """
+
+    def __init__(self, path: Path, stale_after: float = CACHE_LOCK_STALE):
+        self.path = path
+        self.stale_after = stale_after
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        if fcntl is not None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            return True
+
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            self._break_stale()
+            return False
+        os.write(fd, f"{os.getpid()} {time.time()}".encode("ascii"))
+        self._fd = fd
+        return True
+
+    def _break_stale(self) -> None:
+        try:
+            age = time.time() - os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return
+        if age < self.stale_after:
+            return
+        # 先改名再删除，多个进程同时回收时只有一个能成功
+        stale_path = self.path.with_name(f"{self.path.name}.{uuid4().hex}.stale")
+        try:
+            os.rename(self.path, stale_path)
+        except OSError:
+            return
+        stale_path.unlink(missing_ok=True)
+        logger.warning(f"回收残留的缓存锁: {self.path} (已存在 {age:.0f}s)")
+
+    @staticmethod
+    def _poll_delays(timeout: float):
+        """两次尝试之间的等待时间：从 CACHE_LOCK_POLL_INTERVAL 开始翻倍，最长 CACHE_LOCK_POLL_MAX，不超过截止时间"""
+        deadline = time.monotonic() + timeout
+        delay = CACHE_LOCK_POLL_INTERVAL
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            yield min(delay, remaining)
+            delay = min(delay * 2, CACHE_LOCK_POLL_MAX)
+
+    def acquire(self, timeout: float = CACHE_LOCK_TIMEOUT) -> bool:
+        """阻塞等待（在线程中使用）"""
+        if self.try_acquire():
+            return True
+        for delay in self._poll_delays(timeout):
+            time.sleep(delay)
+            if self.try_acquire():
+                return True
+        return False
+
+    async def acquire_async(self, timeout: float = CACHE_LOCK_TIMEOUT) -> bool:
+        """
+        在事件循环上轮询等待，每次尝试都是非阻塞的（flock LOCK_NB / O_EXCL），不会卡住事件循环。
+        不用 to_thread 阻塞等待：锁可能被其它进程持有整个下载过程（最长 CACHE_LOCK_TIMEOUT），
+        等待期间会一直占用默认线程池的线程，多个下载同时等待时渲染任务拿不到线程。
+        """
+        if self.try_acquire():
+            return True
+        for delay in self._poll_delays(timeout):
+            await asyncio.sleep(delay)
+            if self.try_acquire():
+                return True
+        return False
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        else:
+            os.close(fd)
+            self.path.unlink(missing_ok=True)
+
+
+class ProfileSession:
+    """
+    一次按需性能分析：接下来的若干次 jrys 请求
+    下载阶段与渲染阶段分别累计到两个 cProfile 中，同时用 tracemalloc 对比开始与结束时的内存分配。
+    同一时间只分析一个请求（cProfile 不能重复启用），其余请求照常执行。
+    下载阶段只在本请求的协程每次被调度执行时启用分析器，事件循环上其他请求与后台任务不计入。
+    """
+
+    def __init__(self, requests: int, out_dir: Path):
+        self.remaining = requests
+        self.requests = requests
+        self.out_dir = out_dir
+        # 分析相关模块只在 /jrys_profile 开启时导入，不增加插件加载时间
+        import cProfile
+        import tracemalloc
+
+        self.download = cProfile.Profile()
+        self.render = cProfile.Profile()
+        self.active = False
+        self.started_at = datetime.now()
+        self.owns_tracemalloc = not tracemalloc.is_tracing()
+        if self.owns_tracemalloc:
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        self.snapshot = tracemalloc.take_snapshot()
+
+    def claim(self) -> bool:
+        if self.active or self.remaining <= 0:
+            return False
+        self.active = True
+        self.remaining -= 1
+        return True
+
+    @property
+    def done(self) -> bool:
+        return self.remaining <= 0 and not self.active
+
+    def track_download(self, coro):
+        """包装下载阶段的协程，使其每一步都计入 download 分析器"""
+        return _ProfiledAwaitable(self.download, coro)
+
+    def close(self) -> None:
+        import tracemalloc
+
+        if self.owns_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def write_reports(self) -> List[Path]:
+        """写入 .prof 与文本报告（在线程中执行），返回生成的文件"""
+        import pstats
+        import tracemalloc
+
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        prefix = self.started_at.strftime("%Y%m%d_%H%M%S")
+        paths = []
+
+        summary = io.StringIO()
+        summary.write(f"# jrys 性能分析 {self.started_at.isoformat()} 请求数={self.requests}\n")
+        for name, profiler in (("download", self.download), ("render", self.render)):
+            prof_path = self.out_dir / f"{prefix}_{name}.prof"
+            profiler.create_stats()
+            if not profiler.stats:
+                continue
+            profiler.dump_stats(prof_path)
+            paths.append(prof_path)
+            summary.write(f"\n## {name}（按累计耗时排序）\n")
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(
+                PROFILE_REPORT_TOP_N
+            )
+        summary_path = self.out_dir / f"{prefix}_summary.txt"
+        summary_path.write_text(summary.getvalue(), encoding="utf-8")
+        paths.append(summary_path)
+
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            stats = tracemalloc.take_snapshot().compare_to(self.snapshot, "lineno")
+            lines = [
+                "# 内存分配（tracemalloc，相对分析开始时）",
+                f"# 当前 {current / 1024 / 1024:.1f}MB, 峰值 {peak / 1024 / 1024:.1f}MB",
+                "",
+                *(str(stat) for stat in stats[:PROFILE_REPORT_TOP_N]),
+            ]
+            alloc_path = self.out_dir / f"{prefix}_alloc.txt"
+            alloc_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            paths.append(alloc_path)
+        return paths
+
+
+class _ProfiledAwaitable:
+    """
+    逐步驱动被包装的协程，只在协程自身执行（send/throw）期间启用分析器。
+    协程挂起等待 I/O 时分析器关闭，这期间事件循环调度的其他任务不会混入结果。
+    """
+
+    __slots__ = ("_profiler", "_coro")
+
+    def __init__(self, profiler, coro):
+        self._profiler = profiler
+        self._coro = coro
+
+    def __await__(self):
+        step = self._coro.__await__()
+        send, error = None, None
+        while True:
+            self._profiler.enable()
+            try:
+                if error is not None:
+                    future = step.throw(error)
+                else:
+                    future = step.send(send)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self._profiler.disable()
+            try:
+                send, error = (yield future), None
+            except BaseException as e:
+                send, error = None, e
+
+
+class DownloadRejected(Exception):
+    """下载内容不符合要求（类型/大小/无法解码），不再重试"""
+
+
+def sniff_image_format(head: bytes) -> Optional[str]:
+    """根据文件头识别常见图片格式，无法识别时返回 None"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    if head[:2] == b"BM":
+        return "BMP"
+    return None
+
+
+def verify_image_file(path) -> None:
+    """用 PIL 校验图片文件的完整性（不完整解码），失败时抛出 DownloadRejected"""
+    try:
+        with Image.open(path) as img:
+            img.verify()
+    except Exception as e:
+        raise DownloadRejected(f"图片校验失败: {type(e).__name__}: {e}") from e
+
+
+def image_dhash(path) -> int:
+    """计算图片的 64 位差值哈希（dHash），用于发现近似重复的图片"""
+    with Image.open(path) as img:
+        img.draft("L", (64, 64))  # JPEG 可直接以缩小尺寸解码
+        small = img.convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+class FortuneRecord:
+    """
+    运势条目：原始文本 + 排版结果（换行后的文本行与派生的纵向位置）
+    排版结果在条目第一次被渲染时计算（JrysPlugin._layout_record），此前为 None。
+    """
+
+    __slots__ = (
+        "key",
+        "index",
+        "luck_value",
+        "summary",
+        "lucky_star",
+        "sign_text",
+        "unsign_text",
+        "summary_lines",
+        "lucky_star_lines",
+        "sign_lines",
+        "unsign_lines",
+        "unsign_y",
+        "warning_y",
+    )
+
+    # 排版结果字段（其余字段为原始文本），summary_lines 最后写入，非 None 即表示排版完成
+    LAYOUT_FIELDS = (
+        "lucky_star_lines",
+        "sign_lines",
+        "unsign_lines",
+        "unsign_y",
+        "warning_y",
+        "summary_lines",
+    )
+
+    def __init__(self, *values):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @property
+    def laid_out(self) -> bool:
+        return self.summary_lines is not None
+
+    def source(self) -> tuple:
+        """条目内容（不含排版结果），用作文字层缓存与热重载比较的键"""
+        return tuple(
+            getattr(self, name) for name in self.__slots__ if name not in self.LAYOUT_FIELDS
+        )
+
+    def layout(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.LAYOUT_FIELDS)
+
+    def set_layout(self, values) -> None:
+        for name, value in zip(self.LAYOUT_FIELDS, values):
+            setattr(self, name, value)
+
+
+class RenderLayout:
+    """
+    渲染排版参数，像素值均已按 render_scale 缩放
+    参考排版为 IMAGE_WIDTH x IMAGE_HEIGHT，图片尺寸不同时由 JrysPlugin._build_render_layout 换算
+    """
+
+    __slots__ = (
+        "scale",
+        "width",
+        "height",
+        "panel",  # 半透明面板 (x, y, 宽, 高, 圆角)
+        "date_y",
+        "summary_y",
+        "lucky_star_y",
+        "sign_text_y",
+        "unsign_text_y",
+        "warning_text_y",
+        "unsign_y_offset",
+        "warning_y_offset",
+        "left_padding",
+        "wrap_width",
+        "avatar_position",
+        "avatar_size",
+    )
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values[name])
+
+    def font_size(self, size: int) -> int:
+        """参考排版中的字号换算为实际字号"""
+        return max(1, round(size * self.scale))
+
+    def key(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+
+class FortuneCorpus:
+    """运势语料：按 jrys.json 中的分组顺序保存 FortuneRecord（warning_lines 与条目一样按需排版）"""
+
+    __slots__ = ("source_hash", "keys", "groups", "warning_lines")
+
+    def __init__(
+        self,
+        source_hash: str,
+        groups: Dict[str, Tuple[FortuneRecord, ...]],
+        warning_lines: Optional[Tuple[str, ...]] = None,
+    ):
+        self.source_hash = source_hash
+        self.keys: List[str] = list(groups)
+        self.groups = groups
+        self.warning_lines = warning_lines
+
+    def __len__(self) -> int:
+        return sum(len(group) for group in self.groups.values())
+
+    def records(self):
+        for group in self.groups.values():
+            yield from group
+
+
+class AvatarEntry:
+    """头像缓存元数据（内存索引）：判断是否过期只需查字典，不必每次 stat 文件"""
+
+    __slots__ = ("path", "mtime", "size")
+
+    def __init__(self, path: str, mtime: float, size: int):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+
 
 @register("今日运势", "ominus", "一个今日运势海报生成图", "1.0.3")
 class JrysPlugin(Star):
@@ -53,19 +656,25 @@ class JrysPlugin(Star):
     def __init__(self, context: Context, config: AstrBotConfig):
         super().__init__(context)
 
+        init_start = time.perf_counter()
         self.config = config
         self.avatar_cache_expiration = self.config.get(
             "avatar_cache_expiration", ONE_DAY_IN_SECONDS
         )  # 默认一天过期
         self.font_name = self.config.get("font_name", FONT_NAME)  # 默认字体名称
 
-        self.image_width = self.config.get("img_width", IMAGE_WIDTH)
-        self.image_height = self.config.get("img_height", IMAGE_HEIGHT)  # 默认图片高度
+        self.image_width = int(self.config.get("img_width", IMAGE_WIDTH))
+        self.image_height = int(self.config.get("img_height", IMAGE_HEIGHT))  # 默认图片高度
 
-        avatar_position_list = self.config.get("avatar_position", list(AVATAR_POSITION))
+        # 配置文件中的键名为 avater_*，兼容手动写成 avatar_* 的配置
+        avatar_position_list = self.config.get(
+            "avater_position", self.config.get("avatar_position", list(AVATAR_POSITION))
+        )
         self.avatar_position = tuple(avatar_position_list)  # 默认头像位置
 
-        avatar_size_list = self.config.get("avatar_size", list(AVATAR_SIZE))
+        avatar_size_list = self.config.get(
+            "avater_size", self.config.get("avatar_size", list(AVATAR_SIZE))
+        )
         self.avatar_size = tuple(avatar_size_list)
 
         self.date_y = self.config.get("date_y_position", DATE_Y)
@@ -75,6 +684,12 @@ class JrysPlugin(Star):
         self.unsign_text_y = self.config.get("unsign_text_y_position", UNSIGN_TEXT_Y)
         self.warning_text_y = self.config.get("warning_text_y_position", WARNING_TEXT_Y)
 
+        # 实际渲染使用的排版（按图片尺寸与 render_scale 换算）
+        self.layout = self._build_render_layout()
+        # 面板 / 头像蒙版缓存，键为尺寸
+        self._panel_masks: Dict[tuple, Image.Image] = {}
+        self._avatar_masks: Dict[Tuple[int, int], Image.Image] = {}
+
         self.data_dir = os.path.dirname(os.path.abspath(__file__))
         self.avatar_dir = os.path.join(self.data_dir, "avatars")
         self.background_dir = os.path.join(self.data_dir, "backgroundFolder")
@@ -84,61 +699,329 @@ class JrysPlugin(Star):
         # 是否启用关键词触发功能
         self.jrys_keyword_enabled = self.config.get("jrys_keyword_enabled", True)
 
-        # 网络请求部分
-        self._http_timeout = aiohttp.ClientTimeout(total=5)  # 设置请求超时时间为5秒
-        self._connection_limit = aiohttp.TCPConnector(limit=10)  # 限制并发连接数为10
-        self._session = aiohttp.ClientSession(
-            timeout=self._http_timeout, connector=self._connection_limit
+        # 延迟启动：目录创建、旧缓存迁移等在后台线程中进行，不阻塞插件加载
+        self.lazy_startup = bool(self.config.get("lazy_startup", True))
+        self._startup_timings: List[Tuple[str, float]] = []
+
+        # 网络请求部分（会话在事件循环中第一次请求时创建，见 _get_session）
+        self._http_timeout = aiohttp.ClientTimeout(total=5)  # 未分类请求的超时时间为5秒
+        self._request_timeouts = {
+            "avatar": self._parse_timeout("avatar_timeout", AVATAR_TIMEOUT),
+            "background": self._parse_timeout("background_timeout", BACKGROUND_TIMEOUT),
+        }
+        self._host_limits = self._parse_host_limits(
+            self.config.get("http_host_limits", list(HTTP_HOST_LIMITS))
         )
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._http_stats = dict.fromkeys(HTTP_STAT_FIELDS, 0)
+        self._download_limits = {
+            "avatar": self._config_number("avatar_max_size_kb", AVATAR_MAX_SIZE_KB, int) * 1024,
+            "background": self._config_number(
+                "background_max_size_kb", BACKGROUND_MAX_SIZE_KB, int
+            ) * 1024,
+        }
+        self._session: Optional[aiohttp.ClientSession] = None
         self._http_headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
         }
 
-        self.fonts = {}
-        FONT_SIZES = [50, 60, 36, 30]  # 字体大小列表
+        # 字体按字号懒加载（self.fonts[size]），字体数据在进程内共享
+        layout_engine_name = str(self.config.get("font_layout_engine", "auto")).lower()
+        self.font_layout_engine = FONT_LAYOUT_ENGINES.get(layout_engine_name)
+        self.fonts = FontMap(FontRegistry(self.font_path, self.font_layout_engine))
+
+        # 子集字体（可选）：只包含语料用到的字形，未覆盖的字符回退到完整字体
+        self.font_subset_enabled = bool(self.config.get("font_subset_enabled", False))
+        self._subset_fonts: Optional[FontMap] = None
+        self._subset_charset: frozenset = frozenset()
+        self._font_subset_task: Optional[asyncio.Task] = None
+
+        # 运势语料（条目按需排版）与用户最近一次背景图记录
+        self._corpus: Optional[FortuneCorpus] = None
+        self._corpus_lock = asyncio.Lock()
+        self._user_last_images: Optional[Dict[str, dict]] = None
+        # 头像缓存索引 {用户 ID: AvatarEntry}，首次获取头像时扫描一次目录，之后随下载更新
+        self._avatar_index: Optional[Dict[str, AvatarEntry]] = None
+
+        # 固定文字层缓存 {(运势分组, 序号): ((left, top), 蒙版)}
+        self.text_sprite_enabled = bool(self.config.get("text_sprite_cache", False))
+        # 以条目内容（FortuneRecord.source()）为键，语料热重载后未变化的条目继续命中
+        self._text_sprites: Dict[tuple, Tuple[Tuple[int, int], Image.Image]] = {}
+        self._text_sprite_task: Optional[asyncio.Task] = None
+
+        # 日期图层缓存 {配色变体: ((left, top), 图层)}，只保存当天的
+        self.date_layer_enabled = bool(self.config.get("date_layer_cache", False))
         try:
-            for size in FONT_SIZES:
-                self.fonts[size] = ImageFont.truetype(self.font_path, size)
-
+            self.date_layer_variants = max(
+                1, int(self.config.get("date_layer_variants", DATE_LAYER_VARIANTS))
+            )
         except Exception:
-            logger.error(f"无法加载字体文件 {self.font_path},使用默认字体回退")
-            self.default_font = ImageFont.load_default()
-            for size in FONT_SIZES:
-                self.fonts[size] = self.default_font
+            self.date_layer_variants = DATE_LAYER_VARIANTS
+        self._date_layers: Dict[int, Tuple[Tuple[int, int], Image.Image]] = {}
+        self._date_layers_day: Optional[str] = None
 
-        # 初始化jrys数据
-        self.jrys_data = {}
-        self.is_data_loaded = False
-
-        # 确保目录存在
-        os.makedirs(self.avatar_dir, exist_ok=True)
-        os.makedirs(self.background_dir, exist_ok=True)
-        os.makedirs(self.font_dir, exist_ok=True)
+        # 确保目录存在（延迟启动时由 _ensure_storage_dirs 按需创建）
+        if not self.lazy_startup:
+            os.makedirs(self.avatar_dir, exist_ok=True)
+            os.makedirs(self.background_dir, exist_ok=True)
+            os.makedirs(self.font_dir, exist_ok=True)
 
         # 大文件缓存目录（在 initialize() 中初始化为 data/plugin_data/{plugin_name}/...）
         self._storage_initialized = False
+        self._storage_lock = threading.Lock()  # 后台初始化与渲染线程可能同时触发
+        self._storage_task: Optional[asyncio.Task] = None
         self._plugin_data_dir: Optional[Path] = None
         self._background_cache_dir: Optional[Path] = None
         self._background_tmp_dir: Optional[Path] = None
+        self._background_blob_dir: Optional[Path] = None
+        self._background_normalized_dir: Optional[Path] = None
+        self._background_index: Optional[Dict[str, dict]] = None
+        self._background_index_dirty = False
+        # 背景图列表（backgroundFolder/*.txt，文件名 -> URL 列表），首次用到时读取，变化后由热重载替换
+        self._background_catalog: Optional[Dict[str, Tuple[str, ...]]] = None
+        self._background_catalog_signature: Optional[tuple] = None
+        self._local_backgrounds: frozenset = frozenset()  # 背景图列表中的本地图片（绝对路径）
+        self._corpus_signature: Optional[tuple] = None
+        self._corpus_layout_task: Optional[asyncio.Task] = None
+        self._corpus_layout_dirty = False  # 有条目排版后尚未写入排版缓存
+        self._hot_reload_task: Optional[asyncio.Task] = None
+        self._last_image_sweep_task: Optional[asyncio.Task] = None
+        self._janitor_task: Optional[asyncio.Task] = None
+        self._avatar_warmup_task: Optional[asyncio.Task] = None
+        self._live_requests = 0  # 正在处理的 jrys 请求数，后台预热在其为 0 时才下载
+        self._janitor_cursor = (0, 0)  # (目录序号, 已检查的目录项数)，扫描到上限时下轮从这里继续
+        # 按需性能分析（/jrys_profile 开启，未开启时 jrys() 只多一次属性判断）
+        self._profile_session: Optional[ProfileSession] = None
+        self._profile_timeout_task: Optional[asyncio.Task] = None
+        # 多实例共享的缓存目录（头像/背景图/裁剪后的背景图），为空时使用插件数据目录
+        self._shared_cache_dir: Optional[Path] = None
+        self._cache_lock_dir: Optional[Path] = None
         self._precache_task: Optional[asyncio.Task] = None
 
+        # 缓存命中统计（定期写入 KV 与日志）
+        self._cache_stats = {
+            name: dict.fromkeys(CACHE_STAT_FIELDS, 0) for name in CACHE_STAT_NAMES
+        }
+        self._cache_stats_since = datetime.now()
+        self._cache_stats_task: Optional[asyncio.Task] = None
+
+        # 事件循环延迟监控（可选，默认关闭）
+        self._loop_lag_task: Optional[asyncio.Task] = None
+        self._loop_lag_thread: Optional[threading.Thread] = None
+        self._loop_lag_stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._loop_heartbeat = time.monotonic()
+        self._loop_lag_stats = {"samples": 0, "over_threshold": 0, "max_ms": 0.0, "total_ms": 0.0}
+        self._loop_lag_offenders: Counter = Counter()
+        self._loop_lag_stacks: dict = {}
+
+        # 运势排行缓存 {(群号, 日期): (成员集合, 排行结果)}
+        self._rank_cache: Dict[Tuple[str, str], Tuple[frozenset, list]] = {}
+
+        self._startup_timings.append(("init", time.perf_counter() - init_start))
+
     async def initialize(self):
         """插件加载/重载后执行（适合做缓存预热等异步任务）。"""
-        self._ensure_storage_dirs()
+        if self.lazy_startup:
+            self._storage_task = asyncio.create_task(self._prepare_storage())
+        else:
+            await self._prepare_storage()
 
         if self.config.get("pre_cache_background_images", False):
             self._start_background_precache()
 
-    def _migrate_legacy_cache_dir(self, legacy_dir: Path, target_dir: Path, label: str) -> None:
-        """将旧版本缓存目录迁移到标准插件数据目录。"""
+        self._start_cache_stats_reporter()
+
+        self._corpus_layout_task = asyncio.create_task(self._warm_corpus_layout())
+
+        if self.font_subset_enabled:
+            self._font_subset_task = asyncio.create_task(self._warm_font_subset())
+
+        if self.text_sprite_enabled and self.config.get("text_sprite_eager", False):
+            self._text_sprite_task = asyncio.create_task(self._warm_text_sprites())
+
+        if self.config.get("loop_lag_monitor_enabled", False):
+            self._start_loop_lag_monitor()
+
+        if self._config_number("hot_reload_interval", HOT_RELOAD_INTERVAL, float) > 0:
+            self._hot_reload_task = asyncio.create_task(self._watch_data_files())
+
+        self._last_image_sweep_task = asyncio.create_task(self._last_image_sweep_loop())
+
+        if self._config_number("janitor_interval", JANITOR_INTERVAL, float) > 0:
+            self._janitor_task = asyncio.create_task(self._janitor_loop())
+
+        if self._config_number("avatar_warmup_count", 0, int) > 0:
+            self._avatar_warmup_task = asyncio.create_task(self._warm_avatars())
+
+    async def _prepare_storage(self) -> None:
+        """初始化缓存目录（含旧缓存迁移），完成后输出各阶段耗时"""
+        try:
+            await self._ensure_storage_ready()
+        except Exception as e:
+            logger.error(f"初始化插件数据目录失败: {e}")
+        self._log_startup_timings()
+
+    async def _ensure_storage_ready(self) -> None:
+        """在事件循环中使用：目录尚未初始化时在线程中执行 _ensure_storage_dirs"""
+        if not self._storage_initialized:
+            await asyncio.to_thread(self._ensure_storage_dirs)
+
+    def _log_startup_timings(self) -> None:
+        """输出插件启动各阶段耗时（init / storage / migrate 等）。"""
+        timings = " ".join(
+            f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in self._startup_timings
+        )
+        total = sum(seconds for _, seconds in self._startup_timings)
+        logger.info(
+            f"今日运势插件启动耗时: {timings} total={total * 1000:.1f}ms "
+            f"(lazy_startup={self.lazy_startup})"
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取 HTTP 会话（在事件循环中第一次用到时创建，关闭后重新创建）。"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                # limit=0 在 aiohttp 中表示不限制，至少保留 1 个连接
+                limit=max(
+                    1, self._config_number("http_connection_limit", HTTP_CONNECTION_LIMIT, int)
+                ),
+                ttl_dns_cache=self._config_number("http_dns_cache_ttl", HTTP_DNS_CACHE_TTL, int),
+                keepalive_timeout=self._config_number(
+                    "http_keepalive_timeout", HTTP_KEEPALIVE_TIMEOUT, float
+                ),
+                enable_cleanup_closed=True,
+            )
+            self._session = aiohttp.ClientSession(
+                timeout=self._http_timeout,
+                connector=connector,
+                trace_configs=[self._http_trace_config()],
+            )
+        return self._session
+
+    def _build_render_layout(self) -> RenderLayout:
+        """
+        由配置换算出渲染排版
+        1. 图片高度与默认值不同时，仍为默认值的纵向位置（文字、面板、头像）按底部对齐平移，
+           已修改过的位置按配置值使用
+        2. 面板宽度与换行宽度随图片宽度变化
+        3. 所有像素值与字号再按 render_scale 等比缩放
+        """
+        try:
+            scale = float(self.config.get("render_scale", 1.0))
+        except (TypeError, ValueError):
+            scale = 1.0
+        scale = min(1.0, max(RENDER_SCALE_MIN, scale))
+
+        width, height = self.image_width, self.image_height
+        shift = height - IMAGE_HEIGHT
+
+        def anchored(value, default) -> int:
+            value = int(value)
+            return value + shift if value == default else value
+
+        def px(value) -> int:
+            return round(value * scale)
+
+        avatar_x, avatar_y = (int(v) for v in self.avatar_position)
+        avatar_w, avatar_h = (int(v) for v in self.avatar_size)
+
+        return RenderLayout(
+            scale=scale,
+            width=max(1, px(width)),
+            height=max(1, px(height)),
+            panel=(
+                0,
+                px(TEXT_BOX_Y + shift),
+                px(width),
+                px(TEXT_BOX_HEIGHT),
+                px(TEXT_BOX_RADIUS),
+            ),
+            date_y=px(anchored(self.date_y, DATE_Y)),
+            summary_y=px(anchored(self.summary_y, SUMMARY_Y)),
+            lucky_star_y=px(anchored(self.lucky_star_y, LUCKY_STAR_Y)),
+            sign_text_y=px(anchored(self.sign_text_y, SIGN_TEXT_Y)),
+            unsign_text_y=px(anchored(self.unsign_text_y, UNSIGN_TEXT_Y)),
+            warning_text_y=px(anchored(self.warning_text_y, WARNING_TEXT_Y)),
+            unsign_y_offset=px(UNSIGN_TEXT_Y_OFFSET),
+            warning_y_offset=px(WARNING_TEXT_Y_OFFSET),
+            left_padding=px(LEFT_PADDING),
+            wrap_width=px(width - (IMAGE_WIDTH - TEXT_WRAP_WIDTH)),
+            avatar_position=(px(avatar_x), px(anchored(avatar_y, AVATAR_POSITION[1]))),
+            avatar_size=(max(1, px(avatar_w)), max(1, px(avatar_h))),
+        )
+
+    def _config_number(self, key: str, default, cast):
+        try:
+            return max(0, cast(self.config.get(key, default)))
+        except Exception:
+            return default
+
+    def _parse_timeout(self, key: str, default: Tuple[float, float]) -> aiohttp.ClientTimeout:
+        """解析 [连接超时, 读取超时] 配置（秒）。"""
+        try:
+            connect, read = (float(v) for v in self.config.get(key, list(default)))
+        except Exception:
+            connect, read = default
+        # 不设总超时：数据持续到达时大图可以下完，卡住的连接由 sock_read 中止
+        return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+
+    @staticmethod
+    def _parse_host_limits(items) -> Dict[str, int]:
+        """解析 ["qlogo.cn=4", ...] 形式的按域名并发限制。"""
+        limits: Dict[str, int] = {}
+        for item in items or []:
+            host, _, limit = str(item).partition("=")
+            try:
+                if host.strip() and int(limit) > 0:
+                    limits[host.strip().lower()] = int(limit)
+            except ValueError:
+                logger.warning(f"忽略无效的域名并发限制配置: {item}")
+        return limits
+
+    def _request_timeout(self, cache: Optional[str]) -> aiohttp.ClientTimeout:
+        return self._request_timeouts.get(cache or "", self._http_timeout)
+
+    def _host_slot(self, url: str):
+        """返回该 URL 所属域名的并发信号量（未配置限制时返回空上下文）。"""
+        hostname = (urlparse(url).hostname or "").lower()
+        for host, limit in self._host_limits.items():
+            if hostname == host or hostname.endswith("." + host):
+                sem = self._host_semaphores.get(host)
+                if sem is None:
+                    sem = self._host_semaphores[host] = asyncio.Semaphore(limit)
+                return sem
+        return contextlib.nullcontext()
+
+    def _http_trace_config(self) -> aiohttp.TraceConfig:
+        """统计连接新建/复用/排队与 DNS 缓存命中，用于调整连接池参数。"""
+        stats = self._http_stats
+
+        def _counter(field: str):
+            async def _on_event(session, context, params):
+                stats[field] += 1
+
+            return _on_event
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(_counter("requests"))
+        trace_config.on_connection_create_end.append(_counter("connections_created"))
+        trace_config.on_connection_reuseconn.append(_counter("connections_reused"))
+        trace_config.on_connection_queued_start.append(_counter("connections_queued"))
+        trace_config.on_dns_cache_hit.append(_counter("dns_cache_hits"))
+        trace_config.on_dns_cache_miss.append(_counter("dns_cache_misses"))
+        return trace_config
+
+    def _migrate_legacy_cache_dir(self, legacy_dir: Path, target_dir: Path, label: str) -> bool:
+        """将旧版本缓存目录迁移到标准插件数据目录，有文件迁移失败时返回 False。"""
         try:
             if not legacy_dir.exists() or not legacy_dir.is_dir():
-                return
+                return True
 
             legacy_resolved = legacy_dir.resolve()
             target_resolved = target_dir.resolve()
             if legacy_resolved == target_resolved:
-                return
+                return True
 
             target_dir.mkdir(parents=True, exist_ok=True)
 
@@ -194,14 +1077,22 @@ class JrysPlugin(Star):
                     f"from={legacy_dir} to={target_dir} "
                     f"moved={moved} replaced={replaced} skipped={skipped} failed={failed}"
                 )
+            return failed == 0
         except Exception as e:
             logger.warning(f"{label}缓存迁移异常: {e}")
+            return False
 
     def _ensure_storage_dirs(self) -> None:
-        """初始化插件大文件缓存目录（优先 data/plugin_data/{plugin_name}）。"""
+        """初始化插件大文件缓存目录（优先 data/plugin_data/{plugin_name}），会阻塞，事件循环中请用 _ensure_storage_ready"""
         if self._storage_initialized:
             return
+        with self._storage_lock:
+            if not self._storage_initialized:
+                self._init_storage_dirs()
 
+    def _init_storage_dirs(self) -> None:
+        phase_start = time.perf_counter()
+        fallback = False
         try:
             from astrbot.core.utils.astrbot_path import get_astrbot_data_path
 
@@ -210,94 +1101,98 @@ class JrysPlugin(Star):
             data_root_path = data_root if isinstance(data_root, Path) else Path(str(data_root))
             plugin_data_dir = data_root_path / "plugin_data" / plugin_name
             plugin_data_dir.mkdir(parents=True, exist_ok=True)
+        except Exception as e:
+            # 兼容：若无法获取 AstrBot 数据目录，则回退到插件目录
+            logger.warning(f"初始化插件数据目录失败，将回退到插件目录缓存: {e}")
+            plugin_data_dir = Path(self.data_dir)
+            fallback = True
 
-            self._plugin_data_dir = plugin_data_dir
+        self._plugin_data_dir = plugin_data_dir
 
-            cache_dir = plugin_data_dir / "cache"
-            cache_dir.mkdir(parents=True, exist_ok=True)
+        local_cache_dir = plugin_data_dir / "cache"
+        local_cache_dir.mkdir(parents=True, exist_ok=True)
+        cache_dir = local_cache_dir
 
-            self._background_cache_dir = cache_dir / "background_images"
-            self._background_cache_dir.mkdir(parents=True, exist_ok=True)
-            self._background_tmp_dir = cache_dir / "background_images_tmp"
-            self._background_tmp_dir.mkdir(parents=True, exist_ok=True)
+        # 多个 AstrBot 实例可以共用同一个缓存目录，下载/裁剪时通过跨进程锁避免重复处理
+        shared_cache_dir = str(self.config.get("shared_cache_dir", "") or "").strip()
+        if shared_cache_dir:
+            try:
+                cache_dir = Path(shared_cache_dir).expanduser()
+                self._cache_lock_dir = cache_dir / "locks"
+                self._cache_lock_dir.mkdir(parents=True, exist_ok=True)
+                self._shared_cache_dir = cache_dir
+                logger.info(f"使用共享缓存目录: {cache_dir}")
+            except Exception as e:
+                logger.warning(f"共享缓存目录不可用，使用插件数据目录: {e}")
+                cache_dir = local_cache_dir
+                self._cache_lock_dir = None
+
+        # 缓存目录分类：avatars / background_images / background_images_tmp
+        self._background_cache_dir = cache_dir / "background_images"
+        self._background_cache_dir.mkdir(parents=True, exist_ok=True)
+        # 按需下载的临时背景图只属于当前实例（/jrys_last 记录与清理都按实例进行），不放入共享目录
+        self._background_tmp_dir = local_cache_dir / "background_images_tmp"
+        self._background_tmp_dir.mkdir(parents=True, exist_ok=True)
+        # 按内容哈希保存的背景图原件（URL 缓存文件是指向它的硬链接），以及裁剪好的派生图
+        self._background_blob_dir = cache_dir / "background_blobs"
+        self._background_blob_dir.mkdir(parents=True, exist_ok=True)
+        self._background_normalized_dir = cache_dir / "background_normalized"
+        self._background_normalized_dir.mkdir(parents=True, exist_ok=True)
+
+        target_avatar_dir = cache_dir / "avatars"
+        self.avatar_dir = str(target_avatar_dir)
+        os.makedirs(self.avatar_dir, exist_ok=True)
 
-            # 缓存目录分类：avatars / background_images / background_images_tmp
-            target_avatar_dir = cache_dir / "avatars"
-            self.avatar_dir = str(target_avatar_dir)
-            os.makedirs(self.avatar_dir, exist_ok=True)
+        self._startup_timings.append(("storage", time.perf_counter() - phase_start))
 
-            # 迁移旧版本缓存目录（插件目录 / 旧 plugin_data 结构 / 旧 fallback 结构）
-            legacy_avatar_dirs = [
-                Path(self.data_dir) / "avatars",
-                plugin_data_dir / "avatars",
-            ]
-            for legacy_dir in legacy_avatar_dirs:
-                self._migrate_legacy_cache_dir(legacy_dir, target_avatar_dir, label="头像")
+        # 迁移旧版本缓存目录（插件目录 / 旧 plugin_data 结构 / 旧 fallback 结构）
+        # 迁移完成后写入标记文件，之后的加载不再扫描旧目录
+        # 旧目录属于当前实例，标记文件也放在实例自己的缓存目录下
+        marker = local_cache_dir / LEGACY_MIGRATION_MARKER
+        if not marker.exists():
+            phase_start = time.perf_counter()
 
+            legacy_avatar_dirs = [Path(self.data_dir) / "avatars"]
             legacy_background_dirs = [
                 Path(self.background_dir) / "images",  # 旧 fallback 结构
                 Path(self.data_dir) / "background_images",
-                plugin_data_dir / "background_images",
             ]
-            for legacy_dir in legacy_background_dirs:
-                self._migrate_legacy_cache_dir(
-                    legacy_dir, self._background_cache_dir, label="背景图"
-                )
-
             legacy_background_tmp_dirs = [
                 Path(self.background_dir) / "images_tmp",  # 旧 fallback 结构
                 Path(self.data_dir) / "background_images_tmp",
-                plugin_data_dir / "background_images_tmp",
             ]
-            for legacy_dir in legacy_background_tmp_dirs:
-                self._migrate_legacy_cache_dir(
-                    legacy_dir, self._background_tmp_dir, label="背景图临时"
-                )
-
-            self._storage_initialized = True
-            logger.info(f"插件数据目录初始化完成: {plugin_data_dir}")
-        except Exception as e:
-            # 兼容：若无法获取 AstrBot 数据目录，则回退到插件目录
-            logger.warning(f"初始化插件数据目录失败，将回退到插件目录缓存: {e}")
-            self._plugin_data_dir = Path(self.data_dir)
-
-            cache_dir = self._plugin_data_dir / "cache"
-            cache_dir.mkdir(parents=True, exist_ok=True)
-
-            self._background_cache_dir = cache_dir / "background_images"
-            self._background_cache_dir.mkdir(parents=True, exist_ok=True)
-            self._background_tmp_dir = cache_dir / "background_images_tmp"
-            self._background_tmp_dir.mkdir(parents=True, exist_ok=True)
-
-            target_avatar_dir = cache_dir / "avatars"
-            self.avatar_dir = str(target_avatar_dir)
-            os.makedirs(self.avatar_dir, exist_ok=True)
+            if not fallback:
+                legacy_avatar_dirs.append(plugin_data_dir / "avatars")
+                legacy_background_dirs.append(plugin_data_dir / "background_images")
+                legacy_background_tmp_dirs.append(plugin_data_dir / "background_images_tmp")
 
-            legacy_avatar_dirs = [
-                Path(self.data_dir) / "avatars",
-            ]
+            migrated = True
             for legacy_dir in legacy_avatar_dirs:
-                self._migrate_legacy_cache_dir(legacy_dir, target_avatar_dir, label="头像")
-
-            legacy_background_dirs = [
-                Path(self.background_dir) / "images",
-                Path(self.data_dir) / "background_images",
-            ]
+                migrated &= self._migrate_legacy_cache_dir(
+                    legacy_dir, target_avatar_dir, label="头像"
+                )
             for legacy_dir in legacy_background_dirs:
-                self._migrate_legacy_cache_dir(
+                migrated &= self._migrate_legacy_cache_dir(
                     legacy_dir, self._background_cache_dir, label="背景图"
                 )
-
-            legacy_background_tmp_dirs = [
-                Path(self.background_dir) / "images_tmp",
-                Path(self.data_dir) / "background_images_tmp",
-            ]
             for legacy_dir in legacy_background_tmp_dirs:
-                self._migrate_legacy_cache_dir(
+                migrated &= self._migrate_legacy_cache_dir(
                     legacy_dir, self._background_tmp_dir, label="背景图临时"
                 )
 
-            self._storage_initialized = True
+            # 有迁移失败时不写标记，下次加载重试
+            if migrated:
+                try:
+                    marker.write_text(datetime.now().isoformat(), encoding="utf-8")
+                except Exception as e:
+                    logger.warning(f"写入缓存迁移标记失败: {e}")
+            else:
+                logger.warning("部分旧缓存迁移失败，将在下次加载时重试")
+            self._startup_timings.append(("migrate", time.perf_counter() - phase_start))
+
+        self._storage_initialized = True
+        if not fallback:
+            logger.info(f"插件数据目录初始化完成: {plugin_data_dir}")
 
     def _start_background_precache(self) -> None:
         """启动后台预缓存任务（不会阻塞插件加载/重载）。"""
@@ -305,6 +1200,243 @@ class JrysPlugin(Star):
             return
         self._precache_task = asyncio.create_task(self._pre_cache_background_images())
 
+    async def _warm_font_subset(self) -> None:
+        corpus = await self._load_corpus()
+        if corpus:
+            await asyncio.to_thread(self._prepare_font_subset, corpus)
+
+    async def _warm_avatars(self) -> None:
+        """
+        头像预热：按 /jrys_last 记录的生成时间，刷新最近活跃的 avatar_warmup_count 位用户的头像
+        逐个下载且每次间隔 AVATAR_WARMUP_INTERVAL，有用户请求进行中时暂停，不与实时请求争抢连接。
+        剩余有效期不足一半的头像也提前刷新，避免当天晚些时候再次冷启动下载。
+        """
+        count = self._config_number("avatar_warmup_count", 0, int)
+        await asyncio.sleep(AVATAR_WARMUP_DELAY)
+        records = await self._load_user_last_images()
+        users = sorted(records, key=lambda u: records[u].get("time", 0), reverse=True)[:count]
+        index = await self._load_avatar_index()
+
+        refreshed = failed = 0
+        for user_id in users:
+            entry = index.get(user_id)
+            if entry is not None and time.time() - entry.mtime < self.avatar_cache_expiration / 2:
+                continue
+
+            while self._live_requests:
+                await asyncio.sleep(AVATAR_WARMUP_INTERVAL)
+            ok = await self._download_avatar(user_id, retries=0) is not None
+            refreshed += ok
+            failed += not ok
+            await asyncio.sleep(AVATAR_WARMUP_INTERVAL)
+
+        logger.info(
+            f"头像预热完成: 最近活跃 {len(users)} 人, 刷新 {refreshed} 个, 失败 {failed} 个"
+        )
+
+    async def _warm_corpus_layout(self) -> None:
+        """
+        后台排版全部运势条目，完成后写入排版缓存
+        逐条在线程中排版，有用户请求进行中时暂停；请求用到尚未排版的条目时自行排版，不必等待这里。
+        """
+        corpus = await self._load_corpus()
+        if not corpus:
+            return
+        pending = [record for record in corpus.records() if not record.laid_out]
+        start = time.perf_counter()
+        for record in pending:
+            while self._live_requests:
+                await asyncio.sleep(CORPUS_LAYOUT_WAIT)
+            if self._corpus is not corpus:
+                return  # 语料已重新加载，由新的任务继续
+            await asyncio.to_thread(self._layout_record, corpus, record)
+        if pending:
+            logger.info(
+                f"运势排版完成: {len(pending)}/{len(corpus)} 条, 耗时 {time.perf_counter() - start:.2f}s"
+            )
+        await self._flush_corpus_layout()
+
+    async def _flush_corpus_layout(self) -> None:
+        corpus = self._corpus
+        if not self._corpus_layout_dirty or corpus is None:
+            return
+        self._corpus_layout_dirty = False
+        await asyncio.to_thread(self._save_corpus_layout_cache, corpus)
+
+    async def _warm_text_sprites(self) -> None:
+        corpus = await self._load_corpus()
+        if corpus:
+            await asyncio.to_thread(self._build_text_sprites, corpus)
+
+    def _count_cache(self, cache: Optional[str], field: str, amount: int = 1) -> None:
+        """累加缓存统计计数（cache 为 None 时忽略）。"""
+        stats = self._cache_stats.get(cache) if cache else None
+        if stats is not None:
+            stats[field] += amount
+
+    def _cache_stats_snapshot(self) -> dict:
+        snapshot = {name: dict(stats) for name, stats in self._cache_stats.items()}
+        for stats in snapshot.values():
+            lookups = stats["hits"] + stats["misses"] + stats["stale"]
+            stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+        http_stats = dict(self._http_stats)
+        connections = http_stats["connections_created"] + http_stats["connections_reused"]
+        http_stats["reuse_rate"] = (
+            round(http_stats["connections_reused"] / connections, 4) if connections else None
+        )
+        snapshot["http"] = http_stats
+        snapshot["since"] = self._cache_stats_since.isoformat()
+        snapshot["updated_at"] = datetime.now().isoformat()
+        return snapshot
+
+    async def _publish_cache_stats(self) -> None:
+        """将缓存统计写入 KV（cache_stats）并输出到日志。"""
+        snapshot = self._cache_stats_snapshot()
+        # 日志只列出有计数的缓存（例如未启用文字层缓存时 sprite 全为 0），KV 中保留全部字段
+        summary = " | ".join(
+            f"{name}: hits={snapshot[name]['hits']} misses={snapshot[name]['misses']} "
+            f"stale={snapshot[name]['stale']} bytes={snapshot[name]['download_bytes']} "
+            f"failures={snapshot[name]['download_failures']} evictions={snapshot[name]['evictions']} "
+            f"deduped={snapshot[name]['deduped']}"
+            for name in CACHE_STAT_NAMES
+            if any(self._cache_stats[name].values())
+        )
+        logger.info(f"缓存统计: {summary or '暂无'}")
+        http_stats = snapshot["http"]
+        logger.info(
+            f"HTTP 连接统计: requests={http_stats['requests']} "
+            f"created={http_stats['connections_created']} reused={http_stats['connections_reused']} "
+            f"queued={http_stats['connections_queued']} reuse_rate={http_stats['reuse_rate']} "
+            f"dns_hits={http_stats['dns_cache_hits']} dns_misses={http_stats['dns_cache_misses']}"
+        )
+
+        if hasattr(self, "put_kv_data"):
+            try:
+                await self.put_kv_data("cache_stats", snapshot)
+            except Exception as e:
+                logger.warning(f"写入 KV 缓存统计失败: {e}")
+
+    def _start_cache_stats_reporter(self) -> None:
+        """按 cache_stats_log_interval 定期输出缓存统计（<=0 时关闭）。"""
+        try:
+            interval = int(
+                self.config.get("cache_stats_log_interval", CACHE_STATS_LOG_INTERVAL)
+            )
+        except Exception:
+            interval = CACHE_STATS_LOG_INTERVAL
+        if interval <= 0:
+            return
+        if self._cache_stats_task and not self._cache_stats_task.done():
+            return
+
+        async def _report_loop():
+            while True:
+                await asyncio.sleep(interval)
+                await self._publish_cache_stats()
+
+        self._cache_stats_task = asyncio.create_task(_report_loop())
+
+    def _start_loop_lag_monitor(self) -> None:
+        """启动事件循环延迟采样：协程测量调度延迟，看门狗线程在卡顿时抓取阻塞栈。"""
+        if self._loop_lag_task and not self._loop_lag_task.done():
+            return
+        try:
+            threshold_ms = float(
+                self.config.get("loop_lag_threshold_ms", LOOP_LAG_THRESHOLD_MS)
+            )
+        except Exception:
+            threshold_ms = LOOP_LAG_THRESHOLD_MS
+        threshold = max(threshold_ms, 10) / 1000
+
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._loop_heartbeat = time.monotonic()
+        self._loop_lag_stop.clear()
+
+        async def _sample_loop():
+            while True:
+                start = loop.time()
+                await asyncio.sleep(LOOP_LAG_SAMPLE_INTERVAL)
+                lag_ms = max(0.0, (loop.time() - start - LOOP_LAG_SAMPLE_INTERVAL) * 1000)
+                self._loop_heartbeat = time.monotonic()
+
+                stats = self._loop_lag_stats
+                stats["samples"] += 1
+                stats["total_ms"] += lag_ms
+                stats["max_ms"] = max(stats["max_ms"], lag_ms)
+                if lag_ms >= threshold * 1000:
+                    stats["over_threshold"] += 1
+                    logger.warning(f"事件循环延迟 {lag_ms:.0f}ms (阈值 {threshold * 1000:.0f}ms)")
+
+        def _watchdog():
+            reported_beat = None
+            while not self._loop_lag_stop.wait(threshold / 2):
+                beat = self._loop_heartbeat
+                stalled = time.monotonic() - beat
+                # 同一次卡顿只抓取一次栈
+                if stalled < threshold + LOOP_LAG_SAMPLE_INTERVAL or beat == reported_beat:
+                    continue
+                reported_beat = beat
+                try:
+                    frame = sys._current_frames().get(self._loop_thread_id)
+                    if frame is None:
+                        continue
+                    self._record_loop_lag_offender(traceback.extract_stack(frame), stalled)
+                except Exception as e:
+                    logger.warning(f"抓取事件循环阻塞栈失败: {e}")
+
+        self._loop_lag_task = asyncio.create_task(_sample_loop())
+        self._loop_lag_thread = threading.Thread(
+            target=_watchdog, name="jrys-loop-lag-watchdog", daemon=True
+        )
+        self._loop_lag_thread.start()
+        logger.info(f"事件循环延迟监控已启动: threshold={threshold * 1000:.0f}ms")
+
+    def _record_loop_lag_offender(
+        self, stack: traceback.StackSummary, stalled: float
+    ) -> None:
+        """记录阻塞事件循环的调用位置（优先归因到本插件内的帧）。"""
+        plugin_file = os.path.abspath(__file__)
+        offender = stack[-1]
+        for frame in reversed(stack):
+            if os.path.abspath(frame.filename) == plugin_file:
+                offender = frame
+                break
+
+        key = f"{os.path.basename(offender.filename)}:{offender.lineno} {offender.name}"
+        self._loop_lag_offenders[key] += 1
+        formatted = "".join(traceback.format_list(stack[-LOOP_LAG_STACK_DEPTH:]))
+        self._loop_lag_stacks[key] = formatted
+        logger.warning(
+            f"事件循环被阻塞 {stalled * 1000:.0f}ms, 位置: {key}\n{formatted}"
+        )
+
+    def _loop_lag_report(self, top: int = 10) -> str:
+        stats = self._loop_lag_stats
+        samples = stats["samples"]
+        avg_ms = stats["total_ms"] / samples if samples else 0.0
+        lines = [
+            f"事件循环延迟: samples={samples} avg={avg_ms:.1f}ms "
+            f"max={stats['max_ms']:.0f}ms over_threshold={stats['over_threshold']}"
+        ]
+        if not self._loop_lag_offenders:
+            lines.append("暂无阻塞记录")
+        for i, (key, count) in enumerate(self._loop_lag_offenders.most_common(top), 1):
+            lines.append(f"{i}. {key} x{count}")
+        return "\n".join(lines)
+
+    async def _stop_loop_lag_monitor(self) -> None:
+        self._loop_lag_stop.set()
+        if self._loop_lag_task and not self._loop_lag_task.done():
+            self._loop_lag_task.cancel()
+            try:
+                await self._loop_lag_task
+            except asyncio.CancelledError:
+                pass
+        if self._loop_lag_thread is not None:
+            logger.info(self._loop_lag_report())
+            self._loop_lag_thread = None
+
     def _background_cache_path_for_url(self, url: str) -> Path:
         self._ensure_storage_dirs()
         assert self._background_cache_dir is not None
@@ -326,8 +1458,63 @@ class JrysPlugin(Star):
             ext = ".img"
         return self._background_tmp_dir / f"{uuid4().hex}{ext}"
 
+    def _cache_lock(self, key: str) -> Optional[CacheLock]:
+        """共享缓存目录下按键返回跨进程锁，未启用共享缓存时返回 None。"""
+        if self._cache_lock_dir is None:
+            return None
+        stripe = int(sha256(key.encode("utf-8")).hexdigest()[:8], 16) % CACHE_LOCK_STRIPES
+        return CacheLock(self._cache_lock_dir / f"{stripe:03d}.lock")
+
     async def _download_to_path(
-        self, url: str, dest: Path, label: str = "图片", retries: int = 1
+        self,
+        url: str,
+        dest: Path,
+        label: str = "图片",
+        retries: int = 1,
+        cache: Optional[str] = None,
+        dedupe: bool = False,
+    ) -> bool:
+        """
+        下载 url 到 dest（先写临时文件再原子替换），cache 用于统计下载字节与失败次数。
+        dedupe 为 True 时按内容哈希存入背景图原件目录，dest 作为硬链接指向它。
+        共享缓存目录下同一文件同时只有一个进程下载，其余进程等待后直接使用下载结果。
+        """
+        lock = None
+        if self._background_tmp_dir is None or dest.parent != self._background_tmp_dir:
+            lock = self._cache_lock(dest.name)
+        if lock is None:
+            return await self._download_to_path_unlocked(url, dest, label, retries, cache, dedupe)
+
+        def _mtime() -> Optional[float]:
+            try:
+                return os.stat(dest).st_mtime
+            except OSError:
+                return None
+
+        existed_mtime = _mtime()
+        started = time.time()
+        if not await lock.acquire_async():
+            logger.warning(f"等待缓存锁超时，直接下载: {dest.name}")
+            return await self._download_to_path_unlocked(url, dest, label, retries, cache, dedupe)
+        try:
+            # 等待期间其它实例已经下载（或刷新）了同一个文件
+            current_mtime = _mtime()
+            if current_mtime is not None and (existed_mtime is None or current_mtime >= started):
+                if dedupe:
+                    await asyncio.to_thread(self._index_background_file, dest, url)
+                return True
+            return await self._download_to_path_unlocked(url, dest, label, retries, cache, dedupe)
+        finally:
+            lock.release()
+
+    async def _download_to_path_unlocked(
+        self,
+        url: str,
+        dest: Path,
+        label: str,
+        retries: int,
+        cache: Optional[str],
+        dedupe: bool,
     ) -> bool:
         dest.parent.mkdir(parents=True, exist_ok=True)
         retries = max(0, int(retries))
@@ -338,30 +1525,76 @@ class JrysPlugin(Star):
             tmp_path = dest.parent / f"{dest.name}.{uuid4().hex}.tmp"
 
             try:
-                async with self._session.get(url, headers=self._http_headers) as response:
-                    status = response.status
-                    reason = (response.reason or "").strip()
-
-                    if status < 200 or status >= 300:
-                        # 5xx 可能是临时问题，允许重试；其它状态码直接失败
-                        if 500 <= status <= 599 and attempt < retries:
-                            logger.warning(
-                                f"{label}下载失败({attempt + 1}/{retries + 1}): HTTP {status} {reason} | {url}"
-                            )
-                            continue
-
-                        logger.error(f"{label}下载失败: HTTP {status} {reason} | {url}")
-                        return False
+                session = self._get_session()
+                # 按域名限制并发（例如 qlogo / hdslb），未配置的域名只受连接池总数限制
+                async with self._host_slot(url):
+                    async with session.get(
+                        url, headers=self._http_headers, timeout=self._request_timeout(cache)
+                    ) as response:
+                        status = response.status
+                        reason = (response.reason or "").strip()
+
+                        if status < 200 or status >= 300:
+                            # 5xx 可能是临时问题，允许重试；其它状态码直接失败
+                            if 500 <= status <= 599 and attempt < retries:
+                                logger.warning(
+                                    f"{label}下载失败({attempt + 1}/{retries + 1}): HTTP {status} {reason} | {url}"
+                                )
+                                continue
 
-                    # 流式写入，避免一次性读入内存
-                    async with aiofiles.open(tmp_path, "wb") as f:
-                        async for chunk in response.content.iter_chunked(64 * 1024):
-                            await f.write(chunk)
+                            logger.error(f"{label}下载失败: HTTP {status} {reason} | {url}")
+                            self._count_cache(cache, "download_failures")
+                            return False
+
+                        # 下载前检查类型与大小，不符合时直接中止
+                        max_bytes = self._download_limits.get(cache or "", DEFAULT_MAX_DOWNLOAD_BYTES)
+                        content_type = (response.content_type or "").lower()
+                        if content_type and not (
+                            content_type.startswith("image/")
+                            or content_type in ALLOWED_BINARY_CONTENT_TYPES
+                        ):
+                            raise DownloadRejected(f"Content-Type 不是图片: {content_type}")
+                        if response.content_length and response.content_length > max_bytes:
+                            raise DownloadRejected(
+                                f"文件过大: {response.content_length} > {max_bytes} bytes"
+                            )
 
-                await asyncio.to_thread(os.replace, tmp_path, dest)
+                        # 流式写入，避免一次性读入内存；边下载边检查文件头与累计大小
+                        received = 0
+                        head = b""
+                        hasher = sha256()
+                        async with aiofiles.open(tmp_path, "wb") as f:
+                            async for chunk in response.content.iter_chunked(64 * 1024):
+                                if len(head) < IMAGE_SNIFF_BYTES:
+                                    head += chunk[: IMAGE_SNIFF_BYTES - len(head)]
+                                    if len(head) >= IMAGE_SNIFF_BYTES and not sniff_image_format(head):
+                                        raise DownloadRejected("文件头不是可识别的图片格式")
+                                received += len(chunk)
+                                if received > max_bytes:
+                                    raise DownloadRejected(f"文件过大: 超过 {max_bytes} bytes")
+                                hasher.update(chunk)
+                                await f.write(chunk)
+
+                        if not sniff_image_format(head):
+                            raise DownloadRejected("文件头不是可识别的图片格式")
+
+                # 写入缓存前确认图片可以正常解码，避免损坏文件在生成图片时才出错
+                await asyncio.to_thread(verify_image_file, tmp_path)
+                if dedupe:
+                    await asyncio.to_thread(
+                        self._store_background_blob, tmp_path, dest, url, hasher.hexdigest()
+                    )
+                else:
+                    await asyncio.to_thread(os.replace, tmp_path, dest)
+                self._count_cache(cache, "download_bytes", received)
                 return True
             except asyncio.CancelledError:
                 raise
+            except DownloadRejected as e:
+                # 内容本身不符合要求，重试也没有意义
+                http_info = f"HTTP {status} {reason} | " if status is not None else ""
+                logger.error(f"{label}下载失败: {http_info}{e} | {url}")
+                break
             except asyncio.TimeoutError:
                 http_info = f"HTTP {status} {reason} | " if status is not None else ""
                 if attempt < retries:
@@ -423,59 +1656,495 @@ class JrysPlugin(Star):
                 except Exception:
                     pass
 
+        self._count_cache(cache, "download_failures")
         return False
 
-    async def _collect_all_background_urls(self) -> List[str]:
-        background_files = await asyncio.to_thread(
-            lambda: [f for f in os.listdir(self.background_dir) if f.endswith(".txt")]
-        )
+    async def _load_background_index(self) -> Dict[str, dict]:
+        """读取背景图索引（URL 缓存文件名 -> {url, sha256}）。"""
+        if self._background_index is not None:
+            return self._background_index
+        await self._ensure_storage_ready()
+        assert self._background_cache_dir is not None
+        path = self._background_cache_dir.parent / BACKGROUND_INDEX_FILE
 
-        urls: set[str] = set()
-        for background_file in background_files:
-            background_file_path = os.path.join(self.background_dir, background_file)
+        def _read() -> Dict[str, dict]:
             try:
-                async with aiofiles.open(background_file_path, "r", encoding="utf-8") as f:
-                    async for line in f:
-                        url = line.strip()
-                        if not url:
-                            continue
-                        if url.startswith("http://") or url.startswith("https://"):
-                            urls.add(url)
+                index = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+                return index if isinstance(index, dict) else {}
             except Exception as e:
-                logger.warning(f"读取背景图列表失败: {background_file_path} | {e}")
-
-        return sorted(urls)
+                logger.warning(f"读取背景图索引失败: {e}")
+                return {}
 
-    async def _pre_cache_background_images(self) -> None:
-        self._ensure_storage_dirs()
+        index = await asyncio.to_thread(_read)
+        if self._background_index is None:
+            self._background_index = index
+        return self._background_index
 
-        urls = await self._collect_all_background_urls()
-        total = len(urls)
-        if total == 0:
-            logger.warning("预缓存背景图：未找到任何图片 URL")
+    async def _flush_background_index(self) -> None:
+        if not self._background_index_dirty or self._background_index is None:
             return
+        self._background_index_dirty = False
+        assert self._background_cache_dir is not None
+        index_path = self._background_cache_dir.parent / BACKGROUND_INDEX_FILE
+        index = dict(self._background_index)
 
-        try:
-            concurrency = int(self.config.get("pre_cache_concurrency", 3))
-        except Exception:
-            concurrency = 3
-        concurrency = max(1, min(concurrency, 10))
+        def _write() -> None:
+            lock = self._cache_lock(BACKGROUND_INDEX_FILE)
+            if lock is None:
+                self._write_json_atomic(index_path, index)
+                return
+            # 共享缓存目录下合并其它实例写入的条目，避免互相覆盖
+            locked = lock.acquire()
+            try:
+                try:
+                    merged = json.loads(index_path.read_text(encoding="utf-8"))
+                    if not isinstance(merged, dict):
+                        merged = {}
+                except (OSError, ValueError):
+                    merged = {}
+                merged.update(index)
+                self._write_json_atomic(index_path, merged)
+                for name, entry in merged.items():
+                    self._background_index.setdefault(name, entry)
+            finally:
+                if locked:
+                    lock.release()
 
-        already_cached = 0
-        to_download: List[Tuple[str, Path]] = []
-        for url in urls:
-            dest = self._background_cache_path_for_url(url)
-            if dest.exists():
-                already_cached += 1
-            else:
-                to_download.append((url, dest))
+        try:
+            await asyncio.to_thread(_write)
+        except Exception as e:
+            logger.warning(f"保存背景图索引失败: {e}")
 
-        logger.info(
-            f"预缓存背景图开始: total={total}, cached={already_cached}, download={len(to_download)}, concurrency={concurrency}"
-        )
+    def _store_background_blob(self, tmp_path: Path, dest: Path, url: str, digest: str) -> None:
+        """
+        按内容哈希保存背景图（在线程中执行）
+        相同内容只保留一份原件，dest 为指向原件的硬链接；文件系统不支持硬链接时直接保存到 dest。
+        """
+        # 原件只按内容哈希命名：同一内容的不同 URL（扩展名不同的镜像、带参数的变体）共用一份
+        assert self._background_blob_dir is not None
+        blob = self._background_blob_dir / digest
+        if blob.exists():
+            tmp_path.unlink(missing_ok=True)
+            self._count_cache("background", "deduped")
+            logger.info(f"背景图内容已存在，复用缓存: {url}")
+        else:
+            os.replace(tmp_path, blob)
+
+        link_tmp = dest.parent / f"{dest.name}.{uuid4().hex}.tmp"
+        try:
+            os.link(blob, link_tmp)
+            os.replace(link_tmp, dest)
+            # dest 已被其它实例链接到同一原件时，POSIX rename 不做任何操作，link_tmp 仍然存在
+            link_tmp.unlink(missing_ok=True)
+        except OSError:
+            link_tmp.unlink(missing_ok=True)
+            shutil.copy2(blob, dest)
+
+        if self._background_index is not None:
+            self._background_index[dest.name] = {"url": url, "sha256": digest}
+            self._background_index_dirty = True
+
+    def _index_background_file(self, dest: Path, url: str) -> None:
+        """把其它实例下载的背景图加入索引（在线程中执行）"""
+        if self._background_index is None or dest.name in self._background_index:
+            return
+        digest = sha256()
+        with open(dest, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        self._background_index[dest.name] = {"url": url, "sha256": digest.hexdigest()}
+        self._background_index_dirty = True
+
+    def _background_content_hash(self, background_path: str) -> Optional[str]:
+        """
+        持久化缓存中的背景图返回其内容哈希，临时下载的背景图返回 None。
+        本地背景图以路径、修改时间与大小作为键（不读取文件内容），文件被替换后自动重新裁剪。
+        """
+        if background_path in self._local_backgrounds:
+            signature = self._file_signature(background_path)
+            if signature is None:
+                return None
+            return sha256(f"local:{background_path}:{signature}".encode("utf-8")).hexdigest()
+        if self._background_index is None or self._background_cache_dir is None:
+            return None
+        path = Path(background_path)
+        if path.parent != self._background_cache_dir:
+            return None
+        entry = self._background_index.get(path.name)
+        return entry.get("sha256") if entry else None
 
-        if hasattr(self, "put_kv_data"):
-            try:
+    def _load_background(self, background_path: str) -> Optional[Image.Image]:
+        """
+        读取裁剪好的背景图
+        持久化缓存中需要缩小的大图按内容哈希保存裁剪结果，内容相同的图片（不同 URL）只处理一次；
+        其余图片每次直接裁剪（见 CROP_MAX_SCALE）。
+        """
+        digest = self._background_content_hash(background_path)
+        normalized_path = None
+        if (
+            digest
+            and self._background_normalized_dir is not None
+            and self._needs_downscale(background_path)
+        ):
+            normalized_path = (
+                self._background_normalized_dir
+                / f"{digest}_{self.layout.width}x{self.layout.height}.png"
+            )
+            if normalized_path.exists():
+                try:
+                    with Image.open(normalized_path) as img:
+                        if img.size == (self.layout.width, self.layout.height):
+                            self._count_cache("normalized", "hits")
+                            image = img.convert("RGB")
+                            # 刷新修改时间，长期未使用的裁剪结果由清理任务删除
+                            with contextlib.suppress(OSError):
+                                os.utime(normalized_path)
+                            return image
+                except Exception as e:
+                    logger.warning(f"读取裁剪后的背景图失败，将重新裁剪: {e}")
+
+        if normalized_path is None:
+            return self.crop_center(background_path)
+
+        # 共享缓存目录下同一张图只由一个进程裁剪，其余进程等待后直接读取结果
+        lock = self._cache_lock(normalized_path.name)
+        locked = lock.acquire() if lock is not None else False
+        try:
+            if locked and normalized_path.exists():
+                try:
+                    with Image.open(normalized_path) as img:
+                        self._count_cache("normalized", "hits")
+                        return img.convert("RGB")
+                except Exception:
+                    pass
+
+            image = self.crop_center(background_path)
+            if image is not None:
+                self._count_cache("normalized", "misses")
+                tmp_path = normalized_path.parent / f"{normalized_path.name}.{uuid4().hex}.tmp"
+                try:
+                    image.save(
+                        tmp_path, format="PNG", compress_level=NORMALIZED_PNG_COMPRESS_LEVEL
+                    )
+                    os.replace(tmp_path, normalized_path)
+                except Exception as e:
+                    logger.warning(f"保存裁剪后的背景图失败: {e}")
+                finally:
+                    tmp_path.unlink(missing_ok=True)
+            return image
+        finally:
+            if locked:
+                lock.release()
+
+    def _needs_downscale(self, background_path: str) -> bool:
+        """原图是否大到 crop_center 需要先缩小（只读取文件头）"""
+        try:
+            with Image.open(background_path) as img:
+                img_width, img_height = img.size
+        except Exception:
+            return False
+        return (
+            img_width > self.layout.width * CROP_MAX_SCALE
+            or img_height > self.layout.height * CROP_MAX_SCALE
+        )
+
+    def _write_background_duplicate_report(self) -> None:
+        """
+        生成背景图重复报告（在线程中执行）
+        列出内容完全相同（sha256）以及感知哈希相近的背景图 URL，便于清理 backgroundFolder 中的冗余链接。
+        """
+        if not self._background_index or self._background_blob_dir is None:
+            return
+        assert self._plugin_data_dir is not None
+
+        assert self._background_cache_dir is not None
+        urls_by_digest: Dict[str, List[str]] = {}
+        file_by_digest: Dict[str, Path] = {}
+        # 下载线程可能同时写入索引，先取快照再遍历
+        for name, entry in list(self._background_index.items()):
+            digest = entry.get("sha256")
+            if not digest:
+                continue
+            urls_by_digest.setdefault(digest, []).append(entry.get("url", name))
+            file_by_digest[digest] = self._background_cache_dir / name
+
+        hashes: List[Tuple[str, int]] = []
+        for digest, path in file_by_digest.items():
+            try:
+                hashes.append((digest, image_dhash(path)))
+            except Exception:
+                continue
+
+        near_groups: List[List[str]] = []
+        grouped = set()
+        for i, (digest, dhash) in enumerate(hashes):
+            if digest in grouped:
+                continue
+            group = [digest]
+            for other_digest, other_hash in hashes[i + 1 :]:
+                if other_digest not in grouped and (dhash ^ other_hash).bit_count() <= PHASH_MAX_DISTANCE:
+                    group.append(other_digest)
+            if len(group) > 1:
+                grouped.update(group)
+                near_groups.append(group)
+
+        exact_groups = [urls for urls in urls_by_digest.values() if len(urls) > 1]
+        lines = [
+            f"# 背景图重复报告 {datetime.now().isoformat()}",
+            f"# 内容完全相同: {len(exact_groups)} 组, 疑似重复: {len(near_groups)} 组",
+            "",
+            "## 内容完全相同（已自动去重，只保留一份文件）",
+        ]
+        for urls in exact_groups:
+            lines.extend(["", *sorted(urls)])
+        lines.extend(["", f"## 疑似重复（感知哈希距离 <= {PHASH_MAX_DISTANCE}）"])
+        for group in near_groups:
+            lines.append("")
+            for digest in group:
+                lines.extend(sorted(urls_by_digest[digest]))
+
+        report_path = self._plugin_data_dir / BACKGROUND_DUPLICATE_REPORT
+        report_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        redundant = sum(len(urls) - 1 for urls in exact_groups) + sum(
+            len(group) - 1 for group in near_groups
+        )
+        logger.info(f"背景图重复报告已生成: {report_path} (可清理 URL 约 {redundant} 个)")
+
+    @staticmethod
+    def _file_signature(path) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _background_catalog_files(self) -> tuple:
+        """
+        backgroundFolder 中各 txt 的 (文件名, 修改时间, 大小) 与各目录的 (路径, 修改时间)
+        目录中增删图片会改变目录的修改时间，用于判断列表是否变化
+        """
+        signature = []
+        for root, dirs, files in os.walk(self.background_dir):
+            dirs.sort()
+            rel_root = os.path.relpath(root, self.background_dir)
+            signature.append((rel_root, self._file_signature(root)))
+            if rel_root == ".":
+                signature.extend(
+                    (name, self._file_signature(os.path.join(root, name)))
+                    for name in sorted(files)
+                    if name.endswith(".txt")
+                )
+        return tuple(signature)
+
+    @staticmethod
+    def _resolve_background_source(line: str, base_dir: str) -> Optional[str]:
+        """
+        解析背景图列表中的一行
+        http(s) 链接原样返回；file:// 与本地路径（相对路径相对于列表文件所在目录）返回绝对路径；
+        其它协议返回 None
+        """
+        if line.startswith("http://") or line.startswith("https://"):
+            return line
+        if line.startswith("file://"):
+            return os.path.abspath(url2pathname(urlparse(line).path))
+        if "://" in line:
+            return None
+        return os.path.abspath(os.path.join(base_dir, os.path.expanduser(line)))
+
+    def _load_background_catalog_sync(self) -> Tuple[Dict[str, Tuple[str, ...]], tuple]:
+        """
+        读取背景图列表：
+        1. 每个 txt 为一组，每行是 http(s) 链接、file:// 链接或本地图片路径
+        2. 每个子目录为一组（含下级目录），目录中的图片直接作为背景图
+        3. backgroundFolder 根目录下的图片归为一组（LOCAL_BACKGROUND_ROOT_KEY）
+        """
+        signature = self._background_catalog_files()
+        catalog: Dict[str, Tuple[str, ...]] = {}
+        for root, dirs, files in os.walk(self.background_dir):
+            dirs.sort()
+            rel_root = os.path.relpath(root, self.background_dir)
+            if rel_root == ".":
+                for name in sorted(files):
+                    if not name.endswith(".txt"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        with open(path, "r", encoding="utf-8") as f:
+                            sources = (
+                                self._resolve_background_source(line.strip(), root)
+                                for line in f
+                                if line.strip()
+                            )
+                            catalog[name] = tuple(source for source in sources if source)
+                    except Exception as e:
+                        logger.warning(f"读取背景图列表失败: {path} | {e}")
+
+            images = tuple(
+                os.path.abspath(os.path.join(root, name))
+                for name in sorted(files)
+                if name.lower().endswith(LOCAL_BACKGROUND_EXTENSIONS)
+            )
+            if images:
+                # 子目录下的图片并入顶层子目录那一组
+                key = (
+                    LOCAL_BACKGROUND_ROOT_KEY
+                    if rel_root == "."
+                    else rel_root.split(os.sep, 1)[0] + "/"
+                )
+                catalog[key] = catalog.get(key, ()) + images
+        return catalog, signature
+
+    def _set_background_catalog(
+        self, catalog: Dict[str, Tuple[str, ...]], signature: tuple
+    ) -> None:
+        self._background_catalog = catalog
+        self._background_catalog_signature = signature
+        self._local_backgrounds = frozenset(
+            source
+            for sources in catalog.values()
+            for source in sources
+            if not self._is_remote_background(source)
+        )
+
+    @staticmethod
+    def _is_remote_background(source: str) -> bool:
+        return source.startswith("http://") or source.startswith("https://")
+
+    async def _get_background_catalog(self) -> Dict[str, Tuple[str, ...]]:
+        """背景图列表（组名 -> 链接或本地图片路径），首次调用时读取"""
+        if self._background_catalog is None:
+            catalog, signature = await asyncio.to_thread(self._load_background_catalog_sync)
+            if self._background_catalog is None:
+                self._set_background_catalog(catalog, signature)
+        return self._background_catalog
+
+    async def _watch_data_files(self) -> None:
+        """
+        热重载：定期检查 jrys.json 与背景图列表的修改时间和大小
+        变化后在后台重新解析，校验通过才整体替换；正在进行的渲染继续使用各自拿到的旧快照。
+        """
+        interval = self._config_number("hot_reload_interval", HOT_RELOAD_INTERVAL, float)
+        jrys_path = Path(self.data_dir) / "jrys.json"
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self._corpus is not None:
+                    signature = await asyncio.to_thread(self._file_signature, jrys_path)
+                    if signature is not None and signature != self._corpus_signature:
+                        await self._reload_corpus()
+
+                if self._background_catalog is not None:
+                    signature = await asyncio.to_thread(self._background_catalog_files)
+                    if signature != self._background_catalog_signature:
+                        await self._reload_background_catalog()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"检查运势数据变化失败: {e}")
+
+    async def _reload_corpus(self) -> None:
+        async with self._corpus_lock:
+            old = self._corpus
+            new = await asyncio.to_thread(self._load_corpus_sync)
+            if not new:
+                # 文件写了一半或格式错误时保留旧语料，下次检查到变化再试
+                logger.warning("运势数据文件已修改但无法加载，继续使用当前数据")
+                return
+            if old is not None and new.source_hash == old.source_hash:
+                return
+            if old is not None:
+                # 内容未变化的条目沿用已有的排版结果
+                layouts = {r.source(): r.layout() for r in old.records() if r.laid_out}
+                for record in new.records():
+                    layout = layouts.get(record.source())
+                    if layout is not None and not record.laid_out:
+                        record.set_layout(layout)
+                if new.warning_lines is None:
+                    new.warning_lines = old.warning_lines
+            self._corpus = new
+
+        if self._corpus_layout_task and not self._corpus_layout_task.done():
+            self._corpus_layout_task.cancel()
+        self._corpus_layout_task = asyncio.create_task(self._warm_corpus_layout())
+
+        # 派生缓存按条目增量失效：内容未变化的条目保留文字层
+        alive = {record.source() for record in new.records()}
+        stale = [key for key in list(self._text_sprites) if key not in alive]
+        for key in stale:
+            self._text_sprites.pop(key, None)
+        self._count_cache("sprite", "evictions", len(stale))
+        # 运势分组变化会影响所有人的抽签结果，排行全部重新计算
+        self._rank_cache = {}
+
+        previous = {record.source() for record in old.records()} if old else set()
+        changed = len(alive - previous)
+        logger.info(
+            f"运势数据已重新加载: {len(new)} 条, 新增或修改 {changed} 条, 失效文字层 {len(stale)} 个"
+        )
+
+        if self.font_subset_enabled and not (
+            self._font_subset_task and not self._font_subset_task.done()
+        ):
+            self._font_subset_task = asyncio.create_task(self._warm_font_subset())
+        if self.text_sprite_enabled and self.config.get("text_sprite_eager", False):
+            if not (self._text_sprite_task and not self._text_sprite_task.done()):
+                self._text_sprite_task = asyncio.create_task(self._warm_text_sprites())
+
+    async def _reload_background_catalog(self) -> None:
+        catalog, signature = await asyncio.to_thread(self._load_background_catalog_sync)
+        old_urls = {url for urls in (self._background_catalog or {}).values() for url in urls}
+        new_urls = {url for urls in catalog.values() for url in urls}
+        self._set_background_catalog(catalog, signature)
+        logger.info(
+            f"背景图列表已重新加载: {len(catalog)} 组, {len(new_urls)} 张 "
+            f"(其中本地 {len(self._local_backgrounds)} 张, "
+            f"新增 {len(new_urls - old_urls)}, 移除 {len(old_urls - new_urls)})"
+        )
+        added_remote = any(self._is_remote_background(url) for url in new_urls - old_urls)
+        if added_remote and self.config.get("pre_cache_background_images", False):
+            self._start_background_precache()
+
+    async def _collect_all_background_urls(self) -> List[str]:
+        catalog = await self._get_background_catalog()
+        urls = {
+            url
+            for lines in catalog.values()
+            for url in lines
+            if self._is_remote_background(url)
+        }
+        return sorted(urls)
+
+    async def _pre_cache_background_images(self) -> None:
+        await self._ensure_storage_ready()
+        await self._load_background_index()
+
+        urls = await self._collect_all_background_urls()
+        total = len(urls)
+        if total == 0:
+            logger.warning("预缓存背景图：未找到任何图片 URL")
+            return
+
+        try:
+            concurrency = int(self.config.get("pre_cache_concurrency", 3))
+        except Exception:
+            concurrency = 3
+        concurrency = max(1, min(concurrency, 10))
+
+        already_cached = 0
+        to_download: List[Tuple[str, Path]] = []
+        for url in urls:
+            dest = self._background_cache_path_for_url(url)
+            if dest.exists():
+                already_cached += 1
+            else:
+                to_download.append((url, dest))
+
+        logger.info(
+            f"预缓存背景图开始: total={total}, cached={already_cached}, download={len(to_download)}, concurrency={concurrency}"
+        )
+
+        if hasattr(self, "put_kv_data"):
+            try:
                 await self.put_kv_data(
                     "bg_cache_status",
                     {
@@ -497,7 +2166,9 @@ class JrysPlugin(Star):
             async with sem:
                 if dest.exists():
                     return True
-                return await self._download_to_path(url, dest, label="背景图")
+                return await self._download_to_path(
+                    url, dest, label="背景图", cache="background", dedupe=True
+                )
 
         downloaded = 0
         failed = 0
@@ -534,6 +2205,10 @@ class JrysPlugin(Star):
                 except Exception as e:
                     logger.warning(f"写入 KV 缓存状态失败: {e}")
 
+        await self._flush_background_index()
+        if self.config.get("background_duplicate_report", False):
+            await asyncio.to_thread(self._write_background_duplicate_report)
+
         logger.info(
             f"预缓存背景图完成: total={total}, cached={already_cached}, downloaded={downloaded}, failed={failed}"
         )
@@ -556,9 +2231,7 @@ class JrysPlugin(Star):
     async def jrys_last_command_handler(self, event: AstrMessageEvent):
         """处理 /jrys_last 指令，发送上一次生成的原图"""
         user_id = event.get_sender_id()
-        jrys_data = await self._load_jrys_data()
-        
-        user_last_images = jrys_data.get("_user_last_images", {})
+        user_last_images = await self._load_user_last_images()
         if user_id not in user_last_images:
             yield event.plain_result("你还没有生成过今日运势哦，先发送 jrys 生成一张吧！")
             return
@@ -566,12 +2239,128 @@ class JrysPlugin(Star):
         last_info = user_last_images[user_id]
         path = last_info.get("path")
 
-        if not path or not os.path.exists(path):
-            yield event.plain_result("找不到上一次生成的原图了，可能已被清理，请重新生成～")
-            return
+        if not path or not await aiofiles.os.path.exists(path):
+            # 临时原图已按保留策略清理时，尝试使用同一 URL 的持久化缓存
+            url = last_info.get("url")
+            path = str(self._background_cache_path_for_url(url)) if url else None
+            if not path or not await aiofiles.os.path.exists(path):
+                yield event.plain_result("找不到上一次生成的原图了，可能已被清理，请重新生成～")
+                return
 
         yield event.image_result(path)
 
+    @filter.command("运势排行", alias=["jrys_rank"])
+    async def jrys_rank_command_handler(self, event: AstrMessageEvent):
+        """处理 /运势排行 指令，按幸运值列出本群（或已知用户）今日运势排行，不生成图片"""
+        corpus = await self._load_corpus()
+        if not corpus:
+            yield event.plain_result("运势数据加载失败，请稍后再试～")
+            return
+
+        members = await self._get_rank_members(event)
+        if not members:
+            yield event.plain_result("还没有人生成过今日运势哦，先发送 jrys 生成一张吧！")
+            return
+
+        today_str = datetime.now().strftime("%Y-%m-%d")
+        cache_key = (event.get_group_id() or "", today_str)
+        member_set = frozenset(members)
+        cached = self._rank_cache.get(cache_key)
+        if cached is not None and cached[0] == member_set:
+            ranking = cached[1]
+        else:
+            ranking = self._compute_fortune_ranking(corpus, members, today_str)
+            # 跨天后旧日期的排行不再需要
+            self._rank_cache = {
+                k: v for k, v in self._rank_cache.items() if k[1] == today_str
+            }
+            self._rank_cache[cache_key] = (member_set, ranking)
+
+        lines = [f"今日运势排行（{datetime.now().strftime('%Y/%m/%d')}）"]
+        for i, (_, name, summary, luck_value) in enumerate(ranking[:RANK_TOP_N], 1):
+            lines.append(f"{i}. {name}  {summary}（{luck_value}）")
+
+        user_id = event.get_sender_id()
+        for i, (rank_user_id, _, summary, luck_value) in enumerate(ranking, 1):
+            if rank_user_id == user_id:
+                lines.append(f"你的排名: {i}/{len(ranking)}  {summary}（{luck_value}）")
+                break
+
+        yield event.plain_result("\n".join(lines))
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("jrys_batch")
+    async def jrys_batch_command_handler(self, event: AstrMessageEvent, count: int = 10):
+        """处理 /jrys_batch [人数] 指令，按今日运势排行为本群（或已知用户）前若干人批量生成海报（管理员）"""
+        corpus = await self._load_corpus()
+        if not corpus:
+            yield event.plain_result("运势数据加载失败，请稍后再试～")
+            return
+
+        members = await self._get_rank_members(event)
+        if not members:
+            yield event.plain_result("还没有人生成过今日运势哦，先发送 jrys 生成一张吧！")
+            return
+
+        today_str = datetime.now().strftime("%Y-%m-%d")
+        ranking = self._compute_fortune_ranking(corpus, members, today_str)
+        user_ids = [user_id for user_id, *_ in ranking[: max(1, min(count, BATCH_MAX_USERS))]]
+        yield event.plain_result(f"正在为 {len(user_ids)} 人生成今日运势海报…")
+
+        failed = 0
+        async for user_id, path in self.render_batch(user_ids, corpus):
+            if path is None:
+                failed += 1
+                continue
+            try:
+                yield event.image_result(path)
+            finally:
+                with contextlib.suppress(OSError):
+                    await aiofiles.os.remove(path)
+        if failed:
+            yield event.plain_result(f"有 {failed} 人的海报生成失败，请稍后再试～")
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("jrys_lag")
+    async def jrys_lag_command_handler(self, event: AstrMessageEvent):
+        """处理 /jrys_lag 指令，查看事件循环延迟与阻塞位置排行（管理员）"""
+        if self._loop_lag_task is None:
+            yield event.plain_result("事件循环延迟监控未启用（配置项 loop_lag_monitor_enabled）")
+            return
+        yield event.plain_result(self._loop_lag_report())
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("jrys_profile")
+    async def jrys_profile_command_handler(self, event: AstrMessageEvent, count: int = 5):
+        """处理 /jrys_profile [次数] 指令，分析接下来若干次 jrys 请求的耗时与内存分配（管理员），次数为 0 时取消"""
+        session = self._profile_session
+        if count <= 0:
+            if session is None:
+                yield event.plain_result("当前没有进行中的性能分析")
+                return
+            session.remaining = 0
+            if session.done:
+                await self._finish_profile_session(session)
+            yield event.plain_result("已停止性能分析，已采集的结果会写入插件数据目录")
+            return
+
+        if session is not None:
+            yield event.plain_result(
+                f"性能分析进行中：还剩 {session.remaining}/{session.requests} 次请求"
+            )
+            return
+
+        await self._ensure_storage_ready()
+        assert self._plugin_data_dir is not None
+        count = min(count, PROFILE_MAX_REQUESTS)
+        session = ProfileSession(count, self._plugin_data_dir / "profiles")
+        self._profile_session = session
+        self._profile_timeout_task = asyncio.create_task(self._expire_profile_session(session))
+        yield event.plain_result(
+            f"将分析接下来的 {count} 次运势请求（最长 {PROFILE_TIMEOUT // 60} 分钟），"
+            f"完成后结果写入 {self._plugin_data_dir / 'profiles'}"
+        )
+
     # 处理器2：关键词处理器
     @filter.event_message_type(filter.EventMessageType.ALL)
     async def jrys_keyword_handler(self, event: AstrMessageEvent, *args, **kwargs):
@@ -595,12 +2384,57 @@ class JrysPlugin(Star):
         """
         输入/jrys,"/今日运势", "/运势"指令后，生成今日运势海报
         """
+        self._live_requests += 1
+        try:
+            session = self._profile_session
+            if session is None or not session.claim():
+                async for result in self._jrys(event):
+                    yield result
+                return
+
+            try:
+                async for result in self._jrys(event, session):
+                    yield result
+            finally:
+                session.active = False
+                if session.done:
+                    await self._finish_profile_session(session)
+        finally:
+            self._live_requests -= 1
+
+    async def _expire_profile_session(self, session: ProfileSession) -> None:
+        """超时后停止接收新的分析请求；正在分析的请求结束时由 jrys() 写出结果"""
+        await asyncio.sleep(PROFILE_TIMEOUT)
+        if self._profile_session is not session or session.remaining <= 0:
+            return
+        logger.info(
+            f"性能分析超时，已分析 {session.requests - session.remaining}/{session.requests} 次请求"
+        )
+        session.remaining = 0
+        if session.done:
+            await self._finish_profile_session(session)
+
+    async def _finish_profile_session(self, session: ProfileSession) -> None:
+        if self._profile_session is session:
+            self._profile_session = None
+            timeout_task = self._profile_timeout_task
+            self._profile_timeout_task = None
+            if timeout_task is not None and timeout_task is not asyncio.current_task():
+                timeout_task.cancel()
+        try:
+            paths = await asyncio.to_thread(session.write_reports)
+            logger.info(f"性能分析完成，结果已写入: {', '.join(str(p) for p in paths)}")
+        except Exception as e:
+            logger.error(f"写入性能分析结果失败: {e}")
+        finally:
+            session.close()
 
+    async def _jrys(self, event: AstrMessageEvent, profile: Optional[ProfileSession] = None):
         user_id = event.get_sender_id()
         user_name = event.get_sender_name()
 
-        self.jrys_data = await self._load_jrys_data()  # 确保数据已加载
-        if not self.jrys_data:
+        corpus = await self._load_corpus()  # 确保数据已加载
+        if not corpus:
             logger.error("运势数据未加载或为空")
             yield event.plain_result("运势数据加载失败，请稍后再试～")
             return
@@ -608,13 +2442,19 @@ class JrysPlugin(Star):
         logger.info(f"正在为用户 {user_name}({user_id}) 生成今日运势")
 
         background_path = None
+        background_url = None
         background_should_cleanup = False
 
         try:
 
+            avatar_download = self.get_avatar_img(user_id)
+            background_download = self.get_background_image()
+            if profile is not None:
+                avatar_download = profile.track_download(avatar_download)
+                background_download = profile.track_download(background_download)
             results = await asyncio.gather(
-                self.get_avatar_img(user_id),
-                self.get_background_image(),
+                avatar_download,
+                background_download,
                 return_exceptions=True,  # 捕获异常
             )
 
@@ -630,7 +2470,7 @@ class JrysPlugin(Star):
                 yield event.plain_result("获取背景图片失败，请稍后再试～")
                 return
 
-            background_path, background_should_cleanup = background_result
+            background_path, background_should_cleanup, background_url = background_result
 
             if isinstance(avatar_path, Exception):
                 logger.error(f"获取头像时出错: {avatar_path}")
@@ -652,8 +2492,11 @@ class JrysPlugin(Star):
         try:
 
             logger.info(f"正在为用户 {user_name}({user_id}) 生成今日运势图片")
+            render = self._generate_image_sync
+            if profile is not None:
+                render = functools.partial(profile.render.runcall, self._generate_image_sync)
             temp_file_path = await asyncio.to_thread(
-                self._generate_image_sync, user_id, avatar_path, background_path
+                render, user_id, avatar_path, background_path, corpus
             )
 
             if temp_file_path is None:
@@ -664,11 +2507,8 @@ class JrysPlugin(Star):
             yield event.image_result(temp_file_path)
             logger.info(f"成功为用户 {user_name}({user_id}) 生成今日运势图片")
 
-            # 保存最后一次使用的背景图信息到 jrys_data
-            if "_user_last_images" not in self.jrys_data:
-                self.jrys_data["_user_last_images"] = {}
-            
-            user_last_images = self.jrys_data["_user_last_images"]
+            # 保存最后一次使用的背景图信息
+            user_last_images = await self._load_user_last_images()
             if user_id in user_last_images:
                 old_info = user_last_images[user_id]
                 old_path = old_info.get("path")
@@ -678,330 +2518,1189 @@ class JrysPlugin(Star):
                         await aiofiles.os.remove(old_path)
                     except:
                         pass
-            
+
+            # 同一 URL 已在持久化缓存中（预缓存或其他实例下载）时直接引用缓存，不再保留临时副本
+            record_path, record_cleanup = background_path, background_should_cleanup
+            if background_should_cleanup and background_url:
+                cache_path = self._background_cache_path_for_url(background_url)
+                if await aiofiles.os.path.exists(cache_path):
+                    record_path, record_cleanup = str(cache_path), False
+
             user_last_images[user_id] = {
-                "path": background_path,
-                "should_cleanup": background_should_cleanup
+                "path": record_path,
+                "url": background_url,
+                "should_cleanup": record_cleanup,
+                "name": user_name,
+                "group_id": event.get_group_id() or "",
+                "time": time.time(),
             }
-            await self._save_jrys_data() # 保存更新后的 jrys_data
-            
-            # 标记当前背景图已由 jrys_data 管理，不要在 finally 中清理
-            background_should_cleanup = False 
+            await self._save_user_last_images()
+
+            # 标记当前背景图已由 _user_last_images 管理，不要在 finally 中清理
+            if record_path == background_path:
+                background_should_cleanup = False
 
         except Exception as e:
             logger.error(f"生成运势图片过程中出错: {e}")
             yield event.plain_result("生成图片失败，请稍后再试～")
 
-        finally:
-            # 用完后删除临时文件
+        finally:
+            # 用完后删除临时文件
+
+            if temp_file_path and os.path.exists(temp_file_path):
+                try:
+                    await aiofiles.os.remove(temp_file_path)
+                    logger.info(f"成功删除临时文件")
+
+                except OSError as e:
+                    logger.warning(f"删除临时文件 {temp_file_path} 失败: {e}")
+
+                except FileNotFoundError:
+                    logger.warning(f"临时文件 {temp_file_path} 已经被删除或不存在")
+                    pass
+
+                except Exception as e:
+                    logger.warning(f"删除临时文件 {temp_file_path} 失败: {e}")
+
+            if (
+                background_should_cleanup
+                and background_path
+                and os.path.exists(background_path)
+            ):
+                try:
+                    await aiofiles.os.remove(background_path)
+                except Exception:
+                    pass
+
+    def _generate_image_sync(
+        self,
+        user_id: str,
+        avatar_path: str,
+        background_path: str,
+        corpus: FortuneCorpus,
+        base: Optional[Image.Image] = None,
+    ) -> Optional[str]:
+        """
+            同步函数：执行所有CPU密集的图像处理任务。
+            这个函数将在一个单独的线程中运行，以避免阻塞asyncio事件循环。
+        Args:
+            avatar_path (str): 用户头像的路径
+            background_path (str): 背景图片的路径
+            corpus (FortuneCorpus): 本次渲染使用的运势语料快照
+            base (Image): 已裁剪并加好半透明面板的背景（批量渲染时共用，此处只复制不修改）
+        Returns:
+            Optional[str]: 返回生成的运势海报图片路径，如果失败则返回None
+        """
+        if not corpus:
+            logger.error("运势数据为空")
+            return None
+
+        try:
+            # 获取当前日期字符串
+            today_str = datetime.now().strftime("%Y-%m-%d")
+
+            selected = self._select_fortune(corpus, user_id, today_str)
+            if selected is None:
+                logger.error("运势数据中没有可用的运势条目")
+                return None
+            record, rng = selected
+            self._layout_record(corpus, record)
+
+            # 获取当前日期
+            now = datetime.now()
+            date = f"{now.strftime('%Y/%m/%d')}"
+
+            # 2. 核心图像处理流程
+
+            # 裁切图片并添加半透明图层
+            image = base.copy() if base is not None else self._prepare_base_sync(background_path)
+            if image is None:
+                return None
+            layout = self.layout
+
+            # 在图片上绘制文字（整个渲染过程都在同一张 RGB 画布上原地绘制）
+            draw = ImageDraw.Draw(image)
+
+            # 绘制日期（启用日期图层缓存时，从当天的配色变体中按用户选一个直接贴图）
+            date_layer = None
+            if self.date_layer_enabled:
+                date_layer = self._get_date_layer(
+                    date, rng.randrange(self.date_layer_variants)
+                )
+            if date_layer is not None:
+                (left, top), layer = date_layer
+                image.paste(layer, (left, top), layer)
+            else:
+                image = self.draw_text(
+                    image,
+                    text=date,
+                    position="center",
+                    y=layout.date_y,
+                    color=(255, 255, 255),
+                    font=self._render_font(layout.font_size(50), date),  # 使用50号字体
+                    gradients=True,
+                    rng=rng,
+                    draw=draw,
+                )
+
+            # 绘制幸运星
+            image = self.draw_text(
+                image,
+                text=record.lucky_star,
+                lines=record.lucky_star_lines,
+                position="center",
+                y=layout.lucky_star_y,
+                color=(255, 255, 255),
+                font=self._render_font(
+                    layout.font_size(60), record.lucky_star
+                ),  # 使用60号字体
+                gradients=True,
+                rng=rng,
+                draw=draw,
+            )
+
+            # 绘制固定文本（幸运总结 / 运势文本 / 警告文本），启用文字层缓存时直接贴图
+            sprite = self._get_text_sprite(corpus, record) if self.text_sprite_enabled else None
+            if sprite is not None:
+                (left, top), mask = sprite
+                image.paste(
+                    (255, 255, 255),
+                    (left, top, left + mask.width, top + mask.height),
+                    mask,
+                )
+            else:
+                image = self._draw_static_text(image, corpus, record, (255, 255, 255), draw)
+
+            # 在图片上绘制用户头像
+            image = self.draw_avatar_img(avatar_path, image)
+
+            # 3 . 保存图片到临时文件并且返回路径（画布本身就是 RGB，直接编码）
+            with tempfile.NamedTemporaryFile(
+                prefix=RENDER_TEMP_PREFIX, suffix=".jpg", delete=False
+            ) as temp_file:
+                image.save(temp_file, format="JPEG", quality=85, optimize=True)
+                return temp_file.name
+
+        except Exception as e:
+            logger.error(f"获取运势数据失败: {e}")
+            return None
+
+    def _prepare_base_sync(self, background_path: str) -> Optional[Image.Image]:
+        """读取裁剪好的背景图并添加半透明面板（与用户无关的部分）"""
+        # _load_background 每次返回新的图像，半透明面板可以直接画在上面
+        image = self._load_background(background_path)
+        if image is None:
+            logger.error("裁剪背景图片失败")
+            return None
+
+        panel_x, panel_y, panel_w, panel_h, panel_radius = self.layout.panel
+        return self.add_transparent_layer(
+            image,
+            position=(panel_x, panel_y),
+            box_width=panel_w,
+            box_height=panel_h,
+            radius=panel_radius,
+        )
+
+    async def render_batch(self, user_ids: List[str], corpus: Optional[FortuneCorpus] = None):
+        """
+        批量生成运势海报（群内今日运势汇总、定时推送等）
+        1. 最多选 BATCH_BACKGROUNDS 张背景图，用户随机分到其中一张，每张只解码、裁剪、加面板一次
+        2. 所有头像并发获取（共用连接池与按域名并发限制）
+        3. 头像与背景就绪后立即渲染，按完成顺序产出 (user_id, 图片路径)，失败时路径为 None
+        图片为临时文件，由调用方使用后删除。
+        """
+        corpus = corpus or await self._load_corpus()
+        if not corpus or not user_ids:
+            return
+
+        backgrounds = await asyncio.gather(
+            *(self.get_background_image() for _ in range(min(BATCH_BACKGROUNDS, len(user_ids)))),
+            return_exceptions=True,
+        )
+        backgrounds = [b for b in backgrounds if b and not isinstance(b, Exception)]
+        if not backgrounds:
+            logger.error("批量渲染: 获取背景图片失败")
+            for user_id in user_ids:
+                yield user_id, None
+            return
+
+        # 每张背景图的公共底图在第一次用到时准备，同组用户共用
+        bases: Dict[int, asyncio.Task] = {}
+
+        def _base(slot: int) -> asyncio.Task:
+            if slot not in bases:
+                bases[slot] = asyncio.create_task(
+                    asyncio.to_thread(self._prepare_base_sync, backgrounds[slot][0])
+                )
+            return bases[slot]
+
+        render_slots = asyncio.Semaphore(BATCH_RENDER_CONCURRENCY)
+
+        async def _render_one(user_id: str, slot: int) -> Tuple[str, Optional[str]]:
+            try:
+                try:
+                    avatar_path = await self.get_avatar_img(user_id)
+                except Exception as e:
+                    # 与单次渲染一致：头像获取失败时不画头像，照常生成
+                    logger.warning(f"批量渲染: 获取用户 {user_id} 头像失败: {e}")
+                    avatar_path = None
+                base = await _base(slot)
+                if base is None:
+                    return user_id, None
+                async with render_slots:
+                    path = await asyncio.to_thread(
+                        self._generate_image_sync,
+                        user_id,
+                        avatar_path,
+                        backgrounds[slot][0],
+                        corpus,
+                        base,
+                    )
+                return user_id, path
+            except Exception as e:
+                logger.error(f"批量渲染用户 {user_id} 失败: {e}")
+                return user_id, None
+
+        tasks = [
+            asyncio.create_task(_render_one(user_id, random.randrange(len(backgrounds))))
+            for user_id in user_ids
+        ]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in (*tasks, *bases.values()):
+                task.cancel()
+            for path, should_cleanup, _ in backgrounds:
+                if should_cleanup:
+                    with contextlib.suppress(OSError):
+                        await aiofiles.os.remove(path)
+
+    def _draw_static_text(
+        self,
+        image: Image.Image,
+        corpus: FortuneCorpus,
+        record: FortuneRecord,
+        color,
+        draw: Optional[ImageDraw.ImageDraw] = None,
+    ) -> Image.Image:
+        """绘制每个运势条目固定不变的文本（幸运总结、运势文本、警告文本）。"""
+        self._layout_record(corpus, record)
+        layout = self.layout
+        if draw is None:
+            draw = ImageDraw.Draw(image)
+        # 绘制幸运总结
+        image = self.draw_text(
+            image,
+            text=record.summary,
+            lines=record.summary_lines,
+            position="center",
+            y=layout.summary_y,
+            color=color,
+            font=self._render_font(layout.font_size(60), record.summary),  # 使用60号字体
+            draw=draw,
+        )
+        # 绘制运势文本
+        image = self.draw_text(
+            image,
+            text=record.sign_text,
+            lines=record.sign_lines,
+            position="left",
+            y=layout.sign_text_y,
+            color=color,
+            font=self._render_font(layout.font_size(30), record.sign_text),  # 使用30号字体
+            draw=draw,
+        )
+        image = self.draw_text(
+            image,
+            text=record.unsign_text,
+            lines=record.unsign_lines,
+            position="left",
+            y=record.unsign_y,
+            color=color,
+            font=self._render_font(layout.font_size(30), record.unsign_text),  # 使用30号字体
+            draw=draw,
+        )
+        # 绘制警告文本
+        image = self.draw_text(
+            image,
+            text=WARNING_TEXT,
+            lines=corpus.warning_lines,
+            position="center",
+            y=record.warning_y,
+            color=color,
+            font=self._render_font(layout.font_size(30), WARNING_TEXT),  # 使用30号字体
+            draw=draw,
+        )
+        return image
+
+    def _get_text_sprite(
+        self, corpus: FortuneCorpus, record: FortuneRecord
+    ) -> Optional[Tuple[Tuple[int, int], Image.Image]]:
+        """
+        获取运势条目的固定文字层（按需渲染并缓存）
+        文字层为裁剪到文字范围的 L 模式蒙版，贴图时以文字颜色填充。
+        Returns:
+            ((left, top), 蒙版)，渲染失败返回 None
+        """
+        sprite_key = record.source()
+        sprite = self._text_sprites.get(sprite_key)
+        if sprite is not None:
+            self._count_cache("sprite", "hits")
+            return sprite
+
+        self._count_cache("sprite", "misses")
+        try:
+            canvas = Image.new("L", (self.layout.width, self.layout.height), 0)
+            canvas = self._draw_static_text(canvas, corpus, record, 255)
+            bbox = canvas.getbbox()
+            if bbox is None:
+                return None
+            sprite = ((bbox[0], bbox[1]), canvas.crop(bbox))
+            self._text_sprites[sprite_key] = sprite
+            return sprite
+        except Exception as e:
+            logger.error(f"渲染文字层失败: {e}")
+            return None
+
+    def _get_date_layer(
+        self, date: str, variant: int
+    ) -> Optional[Tuple[Tuple[int, int], Image.Image]]:
+        """
+        获取当天日期的渐变色图层（每天每个配色变体只渲染一次，跨天自动失效）
+        Args:
+            date (str): 日期文本（%Y/%m/%d）
+            variant (int): 配色变体序号
+        Returns:
+            ((left, top), RGBA 图层)，渲染失败返回 None
+        """
+        if self._date_layers_day != date:
+            self._count_cache("date_layer", "evictions", len(self._date_layers))
+            self._date_layers = {}
+            self._date_layers_day = date
+
+        layer = self._date_layers.get(variant)
+        if layer is not None:
+            self._count_cache("date_layer", "hits")
+            return layer
+
+        self._count_cache("date_layer", "misses")
+        try:
+            canvas = Image.new("RGBA", (self.layout.width, self.layout.height), (0, 0, 0, 0))
+            canvas = self.draw_text(
+                canvas,
+                text=date,
+                position="center",
+                y=self.layout.date_y,
+                color=(255, 255, 255),
+                font=self._render_font(self.layout.font_size(50), date),  # 使用50号字体
+                gradients=True,
+                rng=random.Random(f"{date}-{variant}"),
+            )
+            bbox = canvas.getchannel("A").getbbox()
+            if bbox is None:
+                return None
+            layer = ((bbox[0], bbox[1]), canvas.crop(bbox))
+            self._date_layers[variant] = layer
+            return layer
+        except Exception as e:
+            logger.error(f"渲染日期图层失败: {e}")
+            return None
+
+    def _build_text_sprites(self, corpus: FortuneCorpus) -> None:
+        """预先渲染全部运势条目的文字层（在线程中执行）。"""
+        start = time.perf_counter()
+        for record in corpus.records():
+            self._get_text_sprite(corpus, record)
+        # 渲染线程可能同时写入文字层缓存，先取快照再统计
+        size = sum(mask.width * mask.height for _, mask in list(self._text_sprites.values()))
+        logger.info(
+            f"文字层缓存预热完成: {len(self._text_sprites)} 条, "
+            f"{size / 1024 / 1024:.1f}MB, 耗时 {time.perf_counter() - start:.2f}s"
+        )
+
+    def _select_fortune(
+        self, corpus: FortuneCorpus, user_id: str, today_str: str
+    ) -> Optional[Tuple[FortuneRecord, random.Random]]:
+        """
+        根据用户ID和日期确定性地选出今日运势
+        Args:
+            corpus (FortuneCorpus): 运势语料
+            user_id (str): 用户 ID
+            today_str (str): 日期字符串（%Y-%m-%d）
+        Returns:
+            (运势条目, 已消耗选择步骤的随机数生成器)，数据为空时返回 None
+        """
+        if not corpus.keys:
+            return None
+
+        # 结合用户ID和日期生成一个确定性的种子，以确保该用户今日运势固定
+        rng = random.Random(f"{user_id}-{today_str}")
+        key_1 = rng.choice(corpus.keys)
+        group = corpus.groups[key_1]
+        key_2 = rng.choice(range(len(group)))
+        return group[key_2], rng
+
+    def _compute_fortune_ranking(
+        self, corpus: FortuneCorpus, members: Dict[str, str], today_str: str
+    ) -> List[Tuple[str, str, str, int]]:
+        """
+        批量计算成员今日运势并按幸运值排序（不涉及任何图片处理）
+        Args:
+            corpus: 运势语料
+            members: {user_id: 显示名称}
+            today_str: 日期字符串（%Y-%m-%d）
+        Returns:
+            [(user_id, 显示名称, 运势总结, 幸运值)]，按幸运值从高到低排序
+        """
+        ranking = []
+        for user_id, name in members.items():
+            selected = self._select_fortune(corpus, user_id, today_str)
+            if selected is None:
+                continue
+            record, _ = selected
+            ranking.append((user_id, name, record.summary, record.luck_value))
+        ranking.sort(key=lambda item: (-item[3], item[0]))
+        return ranking
+
+    async def _get_rank_members(self, event: AstrMessageEvent) -> Dict[str, str]:
+        """
+        获取参与排行的用户 {user_id: 显示名称}
+        1. 群聊且平台支持时，获取完整群成员列表
+        2. 否则使用生成过运势的已知用户（群聊时只取本群）
+        """
+        group_id = event.get_group_id()
+
+        if group_id and event.get_platform_name() == "aiocqhttp":
+            try:
+                member_list = await event.bot.api.call_action(
+                    "get_group_member_list", group_id=int(group_id)
+                )
+                members = {
+                    str(m["user_id"]): m.get("card") or m.get("nickname") or str(m["user_id"])
+                    for m in member_list
+                    if not m.get("is_robot")
+                }
+                if members:
+                    return members
+            except Exception as e:
+                logger.warning(f"获取群成员列表失败，将使用已知用户排行: {e}")
+
+        user_last_images = await self._load_user_last_images()
+        return {
+            user_id: info.get("name") or user_id
+            for user_id, info in user_last_images.items()
+            if not group_id or info.get("group_id") == group_id
+        }
 
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    await aiofiles.os.remove(temp_file_path)
-                    logger.info(f"成功删除临时文件")
+    async def _load_corpus(self) -> Optional[FortuneCorpus]:
+        """
+        加载运势语料（jrys.json）
+        只解析 JSON 并读取磁盘上的排版缓存，不在这里排版：没有缓存的条目在第一次渲染时排版
+        （与逐次渲染时换行的开销相同），其余条目由 _warm_corpus_layout 在后台补齐。
+        """
+        if self._corpus is not None:
+            return self._corpus
 
-                except OSError as e:
-                    logger.warning(f"删除临时文件 {temp_file_path} 失败: {e}")
+        async with self._corpus_lock:
+            if self._corpus is None:
+                await self._ensure_storage_ready()
+                self._corpus = await asyncio.to_thread(self._load_corpus_sync)
+        return self._corpus
 
-                except FileNotFoundError:
-                    logger.warning(f"临时文件 {temp_file_path} 已经被删除或不存在")
-                    pass
+    def _load_corpus_sync(self) -> Optional[FortuneCorpus]:
+        jrys_path = Path(self.data_dir) / "jrys.json"
 
-                except Exception as e:
-                    logger.warning(f"删除临时文件 {temp_file_path} 失败: {e}")
+        # 检查 jrys.json 文件是否存在,如果不存在，则创建一个空的 jrys.json 文件
+        if not jrys_path.exists():
+            jrys_path.write_text(json.dumps({}), encoding="utf-8")
+            logger.info(f"创建空的运势数据文件: {jrys_path}")
 
-            if (
-                background_should_cleanup
-                and background_path
-                and os.path.exists(background_path)
-            ):
-                try:
-                    await aiofiles.os.remove(background_path)
-                except Exception:
-                    pass
+        try:
+            self._corpus_signature = self._file_signature(jrys_path)
+            raw_bytes = jrys_path.read_bytes()
+        except FileNotFoundError:
+            logger.error(f"文件 {jrys_path} 没找到")
+            return None
 
-    def _generate_image_sync(
-        self, user_id: str, avatar_path: str, background_path: str
-    ) -> Optional[str]:
-        """
-            同步函数：执行所有CPU密集的图像处理任务。
-            这个函数将在一个单独的线程中运行，以避免阻塞asyncio事件循环。
-        Args:
-            avatar_path (str): 用户头像的路径
-            background_path (str): 背景图片的路径
-        Returns:
-            Optional[str]: 返回生成的运势海报图片路径，如果失败则返回None
-        """
-        if not self.jrys_data:
-            logger.error("运势数据为空")
+        try:
+            data = json.loads(raw_bytes.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            logger.error(f"文件 {jrys_path} 不是有效的 JSON 格式")
+            return None
+        if not isinstance(data, dict):
+            logger.error(f"文件 {jrys_path} 不是有效的运势数据格式")
             return None
 
-        date_y = self.date_y
-        summary_y = self.summary_y
-        lucky_star_y = self.lucky_star_y
-        sign_text_y = self.sign_text_y
-        unsign_text_y = self.unsign_text_y
-        warning_text_y = self.warning_text_y
+        # 旧版本把用户最近一次背景图记录写在 jrys.json 里，迁移出去以保持语料只读
+        legacy_records = data.pop("_user_last_images", None)
+        if legacy_records is not None:
+            self._migrate_legacy_user_last_images(legacy_records)
+            raw_bytes = json.dumps(data, ensure_ascii=False, indent=4).encode("utf-8")
+            try:
+                jrys_path.write_bytes(raw_bytes)
+            except Exception as e:
+                logger.warning(f"回写运势数据文件失败: {e}")
 
+        logger.info(f"读取运势数据文件: {jrys_path}")
+        corpus = self._parse_corpus(data, sha256(raw_bytes).hexdigest())
+        self._apply_corpus_layout_cache(corpus)
+        return corpus
+
+    def _apply_corpus_layout_cache(self, corpus: FortuneCorpus) -> None:
+        """读取磁盘上的排版缓存（JSON），填入内容与排版配置都未变化的条目"""
+        cache_path = self._corpus_cache_path(corpus.source_hash)
+        if cache_path is None or not cache_path.exists():
+            return
         try:
-            # 获取当前日期字符串
-            today_str = datetime.now().strftime("%Y-%m-%d")
+            payload = json.loads(cache_path.read_text(encoding="utf-8"))
+            if payload.get("version") != COMPILED_CORPUS_VERSION:
+                return
+            records = {(record.key, record.index): record for record in corpus.records()}
+            applied = 0
+            for key, index, layout in payload.get("records", []):
+                record = records.get((key, index))
+                if record is None or len(layout) != len(FortuneRecord.LAYOUT_FIELDS):
+                    continue
+                *line_groups, unsign_y, warning_y, summary_lines = layout
+                record.set_layout(
+                    (
+                        *(tuple(str(line) for line in lines) for lines in line_groups),
+                        int(unsign_y),
+                        int(warning_y),
+                        tuple(str(line) for line in summary_lines),
+                    )
+                )
+                applied += 1
+            warning_lines = payload.get("warning_lines")
+            if warning_lines is not None:
+                corpus.warning_lines = tuple(str(line) for line in warning_lines)
+            logger.info(f"读取运势排版缓存: {cache_path.name} ({applied}/{len(corpus)} 条)")
+        except Exception as e:
+            logger.warning(f"读取运势排版缓存失败，将重新排版: {e}")
+
+    def _save_corpus_layout_cache(self, corpus: FortuneCorpus) -> None:
+        """把已排版的条目写入排版缓存（JSON，在线程中执行），并清理其它语料/排版配置的缓存"""
+        cache_path = self._corpus_cache_path(corpus.source_hash)
+        if cache_path is None:
+            return
+        payload = {
+            "version": COMPILED_CORPUS_VERSION,
+            "source_hash": corpus.source_hash,
+            "warning_lines": corpus.warning_lines,
+            "records": [
+                [record.key, record.index, record.layout()]
+                for record in corpus.records()
+                if record.laid_out
+            ],
+        }
+        try:
+            self._write_json_atomic(cache_path, payload)
+            # 旧版本的 pickle 编译结果与其它（过期的）排版缓存
+            for stale in [*cache_path.parent.glob("*.pickle"), *cache_path.parent.glob("*.json")]:
+                if stale != cache_path:
+                    stale.unlink(missing_ok=True)
+        except Exception as e:
+            logger.warning(f"写入运势排版缓存失败: {e}")
 
-            # 结合用户ID和日期生成一个确定性的种子
-            seed = f"{user_id}-{today_str}"
+    def _corpus_cache_path(self, source_hash: str) -> Optional[Path]:
+        """排版缓存路径：由语料内容、字体与排版配置共同决定。"""
+        if self._plugin_data_dir is None:
+            return None
 
-            # 设置随机种子，以确保该用户今日运势固定
-            random.seed(seed)
+        try:
+            font_stat = os.stat(self.font_path)
+            font_id = f"{self.font_path}:{font_stat.st_size}:{font_stat.st_mtime_ns}"
+        except OSError:
+            font_id = "default"
+
+        layout = (
+            COMPILED_CORPUS_VERSION,
+            source_hash,
+            font_id,
+            FONT_SIZES,
+            str(self.font_layout_engine),
+            self.layout.key(),
+        )
+        key = sha256(repr(layout).encode("utf-8")).hexdigest()[:32]
+        cache_dir = self._plugin_data_dir / "cache" / "corpus"
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        return cache_dir / f"{key}.json"
+
+    def _parse_corpus(self, data: dict, source_hash: str) -> FortuneCorpus:
+        """将 jrys.json 转换为 FortuneCorpus（只取原始文本，排版见 _layout_record）。"""
+        groups: Dict[str, Tuple[FortuneRecord, ...]] = {}
+        for key, entries in data.items():
+            if key.startswith("_") or not isinstance(entries, list) or not entries:
+                continue
+
+            records = []
+            for index, fortune_data in enumerate(entries):
+                try:
+                    luck_value = int(fortune_data.get("luckValue", key))
+                except (TypeError, ValueError):
+                    luck_value = 0
+                records.append(
+                    FortuneRecord(
+                        key,
+                        index,
+                        luck_value,
+                        fortune_data.get("fortuneSummary", "运势数据未知"),
+                        fortune_data.get("luckyStar", "幸运星未知"),
+                        fortune_data.get("signText", "星座运势未知"),
+                        fortune_data.get("unsignText", "非星座运势未知"),
+                    )
+                )
+            groups[key] = tuple(records)
 
-            available_keys_list = list(self.jrys_data.keys())
+        return FortuneCorpus(source_hash, groups)
 
-            key_1 = random.choice(available_keys_list)
+    def _wrap_corpus_text(self, text: str, size: int) -> Tuple[str, ...]:
+        layout = self.layout
+        draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+        font = self.fonts[layout.font_size(size)]
+        return tuple(self.wrap_text(text, font=font, draw=draw, max_width=layout.wrap_width))
 
-            if key_1 not in self.jrys_data:
-                logger.error(f"运势数据中没有找到 {key_1} 的数据")
-                return None
+    def _layout_record(self, corpus: FortuneCorpus, record: FortuneRecord) -> FortuneRecord:
+        """
+        排版运势条目（预先换行并计算 unsign/warning 的纵向位置），已排版时直接返回
+        可以在多个渲染线程中同时调用：结果相同，重复计算只是浪费一次。
+        """
+        if corpus.warning_lines is None:
+            corpus.warning_lines = self._wrap_corpus_text(WARNING_TEXT, 30)
+        if record.laid_out:
+            return record
+
+        layout = self.layout
+        unsign_text_y = layout.unsign_text_y
+        warning_text_y = layout.warning_text_y
+
+        # 如果unsign_lines>3行，怕这个warning_text和unsign_text贴在一起
+        # warning_text_y向下移动 unsign_text_y向上移动
+        unsign_lines = self._wrap_corpus_text(record.unsign_text, 36)
+        if len(unsign_lines) > 3:
+            warning_text_y += (
+                len(unsign_lines) - 3
+            ) * layout.warning_y_offset  # 每行10像素的间距
+            unsign_text_y -= (
+                len(unsign_lines) - 3
+            ) * layout.unsign_y_offset  # 每行15像素的间距
+
+        record.set_layout(
+            (
+                self._wrap_corpus_text(record.lucky_star, 60),
+                self._wrap_corpus_text(record.sign_text, 30),
+                self._wrap_corpus_text(record.unsign_text, 30),
+                unsign_text_y,
+                warning_text_y,
+                self._wrap_corpus_text(record.summary, 60),
+            )
+        )
+        self._corpus_layout_dirty = True
+        return record
 
-            key_2 = random.choice(list(range(len(self.jrys_data[key_1]))))
-            fortune_data = self.jrys_data[key_1][key_2]
+    def _render_font(self, size: int, text: str):
+        """渲染用字体：文字全部在子集字体覆盖范围内时使用子集字体，否则使用完整字体。"""
+        subset_fonts = self._subset_fonts
+        if subset_fonts is not None and self._subset_charset.issuperset(text):
+            return subset_fonts[size]
+        return self.fonts[size]
 
-            # 获取当前日期
-            now = datetime.now()
-            date = f"{now.strftime('%Y/%m/%d')}"
+    def _prepare_font_subset(self, corpus: FortuneCorpus) -> None:
+        """
+        生成（或复用缓存的）子集字体，只保留语料与界面文字用到的字形
+        依赖可选的 fonttools，未安装或生成失败时继续使用完整字体。
+        """
+        if self._plugin_data_dir is None:
+            return
 
-            # 1. 获取运势数据
-            fortune_summary = fortune_data.get("fortuneSummary", "运势数据未知")
-            lucky_star = fortune_data.get("luckyStar", "幸运星未知")
-            sign_text = fortune_data.get("signText", "星座运势未知")
-            unsign_text = fortune_data.get("unsignText", "非星座运势未知")
-            warning_text = "仅供娱乐 | 相信科学 | 请勿迷信"
+        chars = set(FONT_SUBSET_EXTRA_CHARS)
+        for record in corpus.records():
+            chars.update(record.summary, record.lucky_star, record.sign_text, record.unsign_text)
+        charset = "".join(sorted(chars))
 
-            # 如果unsign_lines>3行，怕这个warning_text和unsign_text贴在一起，加个自动换行的
-            unsign_lines = self.wrap_text(
-                unsign_text, font=self.fonts[36], max_width=TEXT_WRAP_WIDTH
-            )
+        try:
+            font_stat = os.stat(self.font_path)
+        except OSError as e:
+            logger.warning(f"生成子集字体失败，使用完整字体: {e}")
+            return
 
-            # 如果unsign_lines>3行，warning_text_y向下移动 unsign_text_y向上移动
-            if len(unsign_lines) > 3:
-                warning_text_y += (
-                    len(unsign_lines) - 3
-                ) * WARNING_TEXT_Y_OFFSET  # 每行10像素的间距
-                unsign_text_y -= (
-                    len(unsign_lines) - 3
-                ) * UNSIGN_TEXT_Y_OFFSET  # 每行15像素的间距
+        key = sha256(
+            repr(
+                (
+                    FONT_SUBSET_VERSION,
+                    self.font_path,
+                    font_stat.st_size,
+                    font_stat.st_mtime_ns,
+                    charset,
+                )
+            ).encode("utf-8")
+        ).hexdigest()[:32]
+        font_ext = os.path.splitext(self.font_path)[1].lower() or ".ttf"
+        subset_dir = self._plugin_data_dir / "cache" / "fonts"
+        subset_path = subset_dir / f"{key}{font_ext}"
+
+        if subset_path.with_suffix(".skip").exists():
+            self._drop_font_subset(subset_dir)
+            return
 
-            # 2. 核心图像处理流程
+        if not subset_path.exists():
+            try:
+                from fontTools import subset as ft_subset
+            except ImportError:
+                logger.warning("未安装 fonttools，无法生成子集字体，使用完整字体")
+                return
 
-            # 裁切图片
-            image = self.crop_center(background_path)
-            if image is None:
-                logger.error("裁剪背景图片失败")
-                return None
+            start = time.perf_counter()
+            subset_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = subset_dir / f"{subset_path.name}.{uuid4().hex}.tmp"
+            try:
+                options = ft_subset.Options()
+                options.layout_features = ["*"]
+                options.name_IDs = ["*"]
+                options.notdef_outline = True
+                ft_font = ft_subset.load_font(self.font_path, options)
+                subsetter = ft_subset.Subsetter(options)
+                subsetter.populate(text=charset)
+                subsetter.subset(ft_font)
+                ft_subset.save_font(ft_font, str(tmp_path), options)
+                os.replace(tmp_path, subset_path)
+            except Exception as e:
+                logger.warning(f"生成子集字体失败，使用完整字体: {e}")
+                return
+            finally:
+                tmp_path.unlink(missing_ok=True)
+
+            # 清理旧的子集字体（语料或字体变化后生成的新文件替代了它们）
+            for stale in [*subset_dir.glob(f"*{font_ext}"), *subset_dir.glob("*.skip")]:
+                if stale != subset_path:
+                    stale.unlink(missing_ok=True)
+
+            if subset_path.stat().st_size >= font_stat.st_size * FONT_SUBSET_MIN_SAVING:
+                # 字体本身已经只包含这些字形（例如自带的字体），子集没有意义
+                subset_path.unlink(missing_ok=True)
+                subset_path.with_suffix(".skip").touch()
+                logger.info("子集字体与完整字体大小相近，继续使用完整字体")
+                self._drop_font_subset(subset_dir)
+                return
 
-            # 添加半透明图层
-            image = self.add_transparent_layer(
-                image, position=(0, 1270), box_width=1080, box_height=700
+            logger.info(
+                f"子集字体生成完成: {len(charset)} 个字符, "
+                f"{font_stat.st_size / 1024:.0f}KB -> {subset_path.stat().st_size / 1024:.0f}KB, "
+                f"耗时 {time.perf_counter() - start:.2f}s"
             )
 
-            # 在图片上绘制文字
+        try:
+            registry = FontRegistry(str(subset_path), self.font_layout_engine)
+            registry.get(FONT_SIZES[0])  # 确认子集字体可以正常加载
+        except Exception as e:
+            logger.warning(f"加载子集字体失败，使用完整字体: {e}")
+            return
 
-            # 绘制日期
-            image = self.draw_text(
-                image,
-                text=date,
-                position="center",
-                y=date_y,
-                color=(255, 255, 255),
-                font=self.fonts[50],  # 使用50号字体
-                gradients=True,
-            )
+        self._subset_charset = frozenset(charset)
+        self._subset_fonts = FontMap(registry)
+        # 旧的子集字体（本实例或重载前的实例加载的）不再使用，释放进程内共享的字体数据
+        FontRegistry.evict_dir(subset_dir, keep=str(subset_path))
 
-            # 绘制幸运总结
-            image = self.draw_text(
-                image,
-                text=fortune_summary,
-                position="center",
-                y=summary_y,
-                color=(255, 255, 255),
-                font=self.fonts[60],  # 使用60号字体
-            )
+    def _drop_font_subset(self, subset_dir: Path) -> None:
+        """不再使用子集字体：回到完整字体并释放已加载的子集字体数据"""
+        self._subset_fonts = None
+        self._subset_charset = frozenset()
+        FontRegistry.evict_dir(subset_dir)
 
-            # 绘制幸运星
-            image = self.draw_text(
-                image,
-                text=lucky_star,
-                position="center",
-                y=lucky_star_y,
-                color=(255, 255, 255),
-                font=self.fonts[60],  # 使用60号字体
-                gradients=True,
-            )
-            # 绘制运势文本
-            image = self.draw_text(
-                image,
-                text=sign_text,
-                position="left",
-                y=sign_text_y,
-                color=(255, 255, 255),
-                font=self.fonts[30],  # 使用30号字体
-            )
-            image = self.draw_text(
-                image,
-                text=unsign_text,
-                position="left",
-                y=unsign_text_y,
-                color=(255, 255, 255),
-                font=self.fonts[30],  # 使用30号字体
-            )
-            # 绘制警告文本
-            image = self.draw_text(
-                image,
-                text=warning_text,
-                position="center",
-                y=warning_text_y,
-                color=(255, 255, 255),
-                font=self.fonts[30],  # 使用30号字体
-            )
+    def _user_last_images_path(self) -> Path:
+        self._ensure_storage_dirs()
+        assert self._plugin_data_dir is not None
+        return self._plugin_data_dir / "user_last_images.json"
 
-            # 在图片上绘制用户头像
-            image = self.draw_avatar_img(avatar_path, image)
+    def _migrate_legacy_user_last_images(self, legacy_records: dict) -> None:
+        """将 jrys.json 中旧的 _user_last_images 合并进独立的记录文件。"""
+        if not isinstance(legacy_records, dict):
+            return
+        path = self._user_last_images_path()
+        try:
+            records = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+        except Exception:
+            records = {}
+        for user_id, info in legacy_records.items():
+            records.setdefault(user_id, info)
+        self._write_json_atomic(path, records)
+        if self._user_last_images is not None:
+            for user_id, info in legacy_records.items():
+                self._user_last_images.setdefault(user_id, info)
+        logger.info(f"已迁移 {len(legacy_records)} 条用户背景图记录到 {path}")
+
+    async def _load_user_last_images(self) -> Dict[str, dict]:
+        """读取用户最近一次使用的背景图记录（user_last_images.json）。"""
+        if self._user_last_images is not None:
+            return self._user_last_images
+
+        await self._ensure_storage_ready()
+        path = self._user_last_images_path()
+
+        def _read() -> Dict[str, dict]:
+            if not path.exists():
+                return {}
+            try:
+                records = json.loads(path.read_text(encoding="utf-8"))
+                return records if isinstance(records, dict) else {}
+            except Exception as e:
+                logger.warning(f"读取用户背景图记录失败: {e}")
+                return {}
 
-            # 3 . 保存图片到临时文件并且返回路径
-            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as temp_file:
-                image = image.convert("RGB")  # 确保图片是RGB模式
-                image.save(temp_file, format="JPEG", quality=85, optimize=True)
-                return temp_file.name
+        records = await asyncio.to_thread(_read)
+        if self._user_last_images is None:
+            self._user_last_images = records
+        return self._user_last_images
 
+    async def _save_user_last_images(self) -> None:
+        """保存用户最近一次使用的背景图记录"""
+        if self._user_last_images is None:
+            return
+        try:
+            await asyncio.to_thread(
+                self._write_json_atomic,
+                self._user_last_images_path(),
+                dict(self._user_last_images),
+            )
         except Exception as e:
-            logger.error(f"获取运势数据失败: {e}")
-            return None
+            logger.error(f"保存用户背景图记录失败: {e}")
 
-        finally:
-            # 无论成功或失败，最后都重置随机种子，以免影响程序其他部分的随机性
-            random.seed(None)
+    async def _last_image_sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(LAST_IMAGE_SWEEP_INTERVAL)
+            try:
+                await self._sweep_last_images()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"清理 /jrys_last 原图失败: {e}")
 
-    async def _load_jrys_data(self) -> dict:
+    async def _sweep_last_images(self) -> None:
         """
-        初始化 jrys.json 文件
-        1. 检查当前目录下是否存在 jrys.json 文件
-        2. 如果不存在，则创建一个空的 jrys.json 文件
-        3. 如果存在，则读取文件内容
-        4. 如果文件内容不是有效的 JSON 格式，则打印错误信息
+        按保留策略清理 /jrys_last 的临时原图（background_images_tmp）
+        1. 超过 last_image_retention_hours 的原图删除
+        2. 剩余原图总大小超过 last_image_max_total_mb 时从最旧的开始删除
+        3. 超过 LAST_IMAGE_RECORD_DAYS 天未生成的用户记录移除
+        持久化缓存中的背景图不在此处清理；记录了 URL 的用户在原图删除后仍可从持久化缓存取图。
         """
+        records = await self._load_user_last_images()
+        if not records:
+            return
+        now = time.time()
+        max_age = self._config_number("last_image_retention_hours", LAST_IMAGE_RETENTION_HOURS, float) * 3600
+        max_bytes = self._config_number("last_image_max_total_mb", LAST_IMAGE_MAX_TOTAL_MB, float) * 1024 * 1024
+
+        # 旧版本记录没有时间，从第一次清理开始计时
+        for info in records.values():
+            info.setdefault("time", now)
+
+        candidates = [
+            (info["time"], user_id, info["path"])
+            for user_id, info in records.items()
+            if info.get("should_cleanup") and info.get("path")
+        ]
+
+        def _plan() -> Tuple[List[Tuple[str, str]], int]:
+            sized = []
+            for recorded_at, user_id, path in candidates:
+                try:
+                    sized.append((recorded_at, user_id, path, os.path.getsize(path)))
+                except OSError:
+                    sized.append((recorded_at, user_id, path, -1))
+            sized.sort()
+            total = sum(size for *_, size in sized if size > 0)
+            expired = []
+            for recorded_at, user_id, path, size in sized:
+                if size >= 0 and now - recorded_at < max_age and total <= max_bytes:
+                    continue
+                expired.append((user_id, path))
+                if size > 0:
+                    total -= size
+                    with contextlib.suppress(OSError):
+                        os.remove(path)
+            return expired, total
+
+        expired, remaining = await asyncio.to_thread(_plan)
+
+        removed_records = 0
+        for user_id, path in expired:
+            info = records.get(user_id)
+            # 期间用户重新生成过时记录已指向新图
+            if info is not None and info.get("path") == path:
+                info["path"] = None
+                info["should_cleanup"] = False
+        for user_id in [
+            user_id
+            for user_id, info in records.items()
+            if now - info["time"] > LAST_IMAGE_RECORD_DAYS * ONE_DAY_IN_SECONDS
+        ]:
+            del records[user_id]
+            removed_records += 1
+
+        if expired or removed_records:
+            await self._save_user_last_images()
+            logger.info(
+                f"/jrys_last 原图清理: 删除 {len(expired)} 张, 移除 {removed_records} 条过期记录, "
+                f"剩余 {remaining / 1024 / 1024:.1f}MB"
+            )
 
-        if self.is_data_loaded:
-            return self.jrys_data
+    async def _janitor_loop(self) -> None:
+        interval = self._config_number("janitor_interval", JANITOR_INTERVAL, float)
+        await asyncio.sleep(JANITOR_STARTUP_DELAY)
+        while True:
+            try:
+                await self._run_janitor()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"清理临时文件失败: {e}")
+            await asyncio.sleep(interval)
 
-        jrys_path = os.path.join(self.data_dir, "jrys.json")
+    async def _run_janitor(self) -> Tuple[int, int]:
+        """
+        清理残留的临时文件，返回 (删除数量, 释放字节数)
+        1. 缓存目录中中断写入留下的 {name}.{uuid}.tmp
+        2. 系统临时目录中渲染崩溃留下的 jrys_render_*.jpg
+        3. background_images_tmp 中没有被 /jrys_last 记录引用的下载
+        4. 不再被任何背景图缓存引用的原件，以及长期未使用的裁剪结果（见 _prune_background_derived_sync）
+        只删除修改时间早于 JANITOR_MIN_AGE 的文件，正在写入/发送的文件不受影响；
+        每轮最多检查 JANITOR_MAX_SCAN 个目录项，目录很大时分多轮完成（下一轮从停下的位置继续）。
+        """
+        await self._ensure_storage_ready()
+        assert self._plugin_data_dir is not None
+        records = await self._load_user_last_images()
+        referenced = {info.get("path") for info in records.values() if info.get("path")}
+
+        cache_root = self._plugin_data_dir / "cache"
+        # (目录, 判断是否为残留文件)
+        is_tmp = lambda name: name.endswith(".tmp")  # noqa: E731
+        targets = [
+            (self._plugin_data_dir, is_tmp),
+            (cache_root / "corpus", is_tmp),
+            (cache_root / "fonts", is_tmp),
+            (Path(self.avatar_dir), is_tmp),
+            (self._background_cache_dir, is_tmp),
+            (self._background_blob_dir, is_tmp),
+            (self._background_normalized_dir, is_tmp),
+            (self._background_tmp_dir, lambda name: True),
+            (
+                Path(tempfile.gettempdir()),
+                lambda name: name.startswith(RENDER_TEMP_PREFIX) and name.endswith(".jpg"),
+            ),
+        ]
+        min_age = self._config_number("janitor_min_age", JANITOR_MIN_AGE, float)
+        start, offset = self._janitor_cursor
+
+        def _sweep() -> Tuple[int, int, int, Tuple[int, int]]:
+            cutoff = time.time() - min_age
+            removed = reclaimed = scanned = 0
+            for index in range(start, len(targets)):
+                directory, match = targets[index]
+                if directory is None or not directory.is_dir():
+                    continue
+                skip = offset if index == start else 0
+                position = 0
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        position += 1
+                        if position <= skip:
+                            continue
+                        if scanned >= JANITOR_MAX_SCAN:
+                            return removed, reclaimed, scanned, (index, position - 1)
+                        scanned += 1
+                        if not match(entry.name) or entry.path in referenced:
+                            continue
+                        try:
+                            if not entry.is_file(follow_symlinks=False):
+                                continue
+                            st = entry.stat(follow_symlinks=False)
+                            if st.st_mtime > cutoff:
+                                continue
+                            os.remove(entry.path)
+                        except OSError:
+                            continue
+                        removed += 1
+                        reclaimed += st.st_size
+            return removed, reclaimed, scanned, (0, 0)
+
+        removed, reclaimed, scanned, self._janitor_cursor = await asyncio.to_thread(_sweep)
+        pruned, pruned_bytes = await asyncio.to_thread(self._prune_background_derived_sync, min_age)
+        removed += pruned
+        reclaimed += pruned_bytes
+
+        if removed:
+            logger.info(
+                f"临时文件清理: 删除 {removed} 个, 释放 {reclaimed / 1024 / 1024:.1f}MB "
+                f"(检查 {scanned} 项)"
+            )
+        return removed, reclaimed
 
-        # 检查 jrys.json 文件是否存在,如果不存在，则创建一个空的 jrys.json 文件
-        if not os.path.exists(jrys_path):
-            async with aiofiles.open(jrys_path, "w", encoding="utf-8") as f:
-                await f.write(json.dumps({}))
-                logger.info(f"创建空的运势数据文件: {jrys_path}")
+    def _prune_background_derived_sync(self, min_age: float) -> Tuple[int, int]:
+        """
+        清理背景图派生文件（在线程中执行），返回 (删除数量, 释放字节数)
+        1. background_blobs：没有缓存文件硬链接指向（链接数为 1）且索引中没有缓存文件引用该哈希的原件
+        2. background_normalized：超过 NORMALIZED_MAX_IDLE_DAYS 天未使用的裁剪结果，以及旧版本的 JPEG 裁剪结果
+        多实例共享缓存时以磁盘上合并后的索引为准，裁剪结果按使用时间清理，不依赖本实例的排版尺寸。
+        """
+        if self._background_blob_dir is None or self._background_normalized_dir is None:
+            return 0, 0
+        assert self._background_cache_dir is not None
 
-        # 读取 JSON 文件
+        index = dict(self._background_index or {})
         try:
-            async with aiofiles.open(jrys_path, "r", encoding="utf-8") as f:
-                content = await f.read()
-                # json.loads是CPU密集型，用 to_thread 包装
-                self.jrys_data = await asyncio.to_thread(json.loads, content)
-                self.is_data_loaded = True  # 标记数据已加载
-                logger.info(f"读取运势数据文件: {jrys_path}")
+            on_disk = json.loads(
+                (self._background_cache_dir.parent / BACKGROUND_INDEX_FILE).read_text(encoding="utf-8")
+            )
+            if isinstance(on_disk, dict):
+                index.update(on_disk)
+        except (OSError, ValueError):
+            pass
+        referenced = {
+            entry.get("sha256")
+            for name, entry in index.items()
+            if isinstance(entry, dict) and (self._background_cache_dir / name).exists()
+        }
 
-            return self.jrys_data
+        now = time.time()
+        removed = reclaimed = scanned = 0
 
-        except FileNotFoundError:
-            logger.error(f"文件 {jrys_path} 没找到")
-            return {}
-        except json.JSONDecodeError:
-            logger.error(f"文件 {jrys_path} 不是有效的 JSON 格式")
-            return {}
+        def _remove(entry: os.DirEntry, st: os.stat_result, cache: str) -> None:
+            nonlocal removed, reclaimed
+            try:
+                os.remove(entry.path)
+            except OSError:
+                return
+            removed += 1
+            reclaimed += st.st_size
+            self._count_cache(cache, "evictions")
+
+        with os.scandir(self._background_blob_dir) as entries:
+            for entry in entries:
+                if scanned >= JANITOR_MAX_SCAN:
+                    break
+                scanned += 1
+                if entry.name.endswith(".tmp") or not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                digest = os.path.splitext(entry.name)[0]
+                if st.st_nlink > 1 or digest in referenced or now - st.st_mtime < min_age:
+                    continue
+                _remove(entry, st, "background")
+
+        max_idle = NORMALIZED_MAX_IDLE_DAYS * ONE_DAY_IN_SECONDS
+        scanned = 0
+        with os.scandir(self._background_normalized_dir) as entries:
+            for entry in entries:
+                if scanned >= JANITOR_MAX_SCAN:
+                    break
+                scanned += 1
+                if entry.name.endswith(".tmp") or not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                legacy = entry.name.endswith(".jpg") and now - st.st_mtime >= min_age
+                if legacy or now - st.st_mtime > max_idle:
+                    _remove(entry, st, "normalized")
+
+        return removed, reclaimed
 
-    async def _save_jrys_data(self):
-        """保存 jrys 数据到 jrys.json"""
-        jrys_path = os.path.join(self.data_dir, "jrys.json")
+    @staticmethod
+    def _write_json_atomic(path: Path, data) -> None:
+        tmp_path = path.parent / f"{path.name}.{uuid4().hex}.tmp"
         try:
-            async with aiofiles.open(jrys_path, "w", encoding="utf-8") as f:
-                content = await asyncio.to_thread(json.dumps, self.jrys_data, ensure_ascii=False, indent=4)
-                await f.write(content)
-        except Exception as e:
-            logger.error(f"保存运势数据失败: {e}")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
 
-    async def get_background_image(self) -> Optional[Tuple[str, bool]]:
+    async def get_background_image(self) -> Optional[Tuple[str, bool, str]]:
         """
         随机获取背景图片
-        1. 在当前目录下的 backgroundFolder 文件夹中查找所有的 txt 文件
-        2. 随机选择一个 txt 文件
-        3. 从选中的 txt 文件中随机选择一行
-        4. 将选中的行作为图片的 URL
-        5.返回图片路径，以及是否需要清理
+        1. 读取 backgroundFolder 中的背景图列表（txt 文件与本地图片目录，见 _load_background_catalog_sync）
+        2. 随机选择一组
+        3. 从选中的组中随机选择一张
+        4. 链接按需下载（或命中缓存），本地图片直接使用
+        5.返回图片路径、是否需要清理，以及图片的 URL（本地图片为其路径）
         """
 
         try:
-            self._ensure_storage_dirs()
+            await self._ensure_storage_ready()
+            await self._load_background_index()
 
-            # 查找所有的 txt 文件
-            background_files = await asyncio.to_thread(
-                lambda: [
-                    f for f in os.listdir(self.background_dir) if f.endswith(".txt")
-                ]
-            )
+            # 所有背景图列表（热重载时整体替换）
+            catalog = await self._get_background_catalog()
 
-            if not background_files:
+            if not catalog:
                 logger.warning("没有找到背景图片文件")
                 return None
-            # 随机选择一个 txt 文件
-            background_file = random.choice(background_files)
-            background_file_path = os.path.join(self.background_dir, background_file)
+            # 随机选择一组（txt 文件或图片目录）
+            background_file = random.choice(list(catalog))
 
-            # 从选中的 txt 文件中随机选择一行
-            async with aiofiles.open(background_file_path, "r", encoding="utf-8") as f:
+            # 从选中的组中随机选择一张
+            background_urls = list(catalog[background_file])
 
-                # 读取文件内容
-                background_urls = [line.strip() async for line in f if line.strip()]
+            if not background_urls:
+                logger.warning(f"文件 {background_file} 中没有找到有效的 URL")
+                return None
 
-                if not background_urls:
-                    logger.warning(f"文件 {background_file} 中没有找到有效的 URL")
-                    return None
+            # 尝试多个 URL，避免个别链接失效导致整体失败
+            random.shuffle(background_urls)
+            max_attempts = min(5, len(background_urls))
 
-                # 尝试多个 URL，避免个别链接失效导致整体失败
-                random.shuffle(background_urls)
-                max_attempts = min(5, len(background_urls))
+            pre_cache_enabled = bool(
+                self.config.get("pre_cache_background_images", False)
+            )
+            cleanup_downloads = bool(
+                self.config.get("cleanup_background_downloads", True)
+            )
 
-                pre_cache_enabled = bool(
-                    self.config.get("pre_cache_background_images", False)
-                )
-                cleanup_downloads = bool(
-                    self.config.get("cleanup_background_downloads", True)
-                )
+            for image_url in background_urls[:max_attempts]:
+                if not self._is_remote_background(image_url):
+                    # 本地图片直接使用，不经过下载；裁剪结果同样进入 background_normalized 缓存
+                    if await aiofiles.os.path.isfile(image_url):
+                        return image_url, False, image_url
+                    logger.warning(f"本地背景图不存在: {image_url}")
+                    continue
 
-                for image_url in background_urls[:max_attempts]:
-                    if not (
-                        image_url.startswith("http://")
-                        or image_url.startswith("https://")
-                    ):
-                        continue
+                cache_path = self._background_cache_path_for_url(image_url)
 
-                    cache_path = self._background_cache_path_for_url(image_url)
+                # 已缓存则直接返回（持久化缓存不做清理）
+                if cache_path.exists():
+                    self._count_cache("background", "hits")
+                    return str(cache_path), False, image_url
 
-                    # 已缓存则直接返回（持久化缓存不做清理）
-                    if cache_path.exists():
-                        return str(cache_path), False
+                self._count_cache("background", "misses")
 
-                    # 未启用预缓存时：默认按需下载后清理；关闭开关则仍然写入持久化缓存目录
-                    image_path = cache_path
-                    should_cleanup = False
-                    if (not pre_cache_enabled) and cleanup_downloads:
-                        image_path = self._background_tmp_path_for_url(image_url)
-                        should_cleanup = True
+                # 未启用预缓存时：默认按需下载后清理；关闭开关则仍然写入持久化缓存目录
+                image_path = cache_path
+                should_cleanup = False
+                if (not pre_cache_enabled) and cleanup_downloads:
+                    image_path = self._background_tmp_path_for_url(image_url)
+                    should_cleanup = True
 
-                    ok = await self._download_to_path(image_url, image_path, label="背景图")
-                    if ok:
-                        logger.info(f"下载图片成功: {image_url}")
-                        return str(image_path), should_cleanup
+                ok = await self._download_to_path(
+                    image_url,
+                    image_path,
+                    label="背景图",
+                    cache="background",
+                    dedupe=not should_cleanup,
+                )
+                if ok and not should_cleanup:
+                    await self._flush_background_index()
+                if ok:
+                    logger.info(f"下载图片成功: {image_url}")
+                    return str(image_path), should_cleanup, image_url
 
-                logger.warning(f"背景图下载失败: 已尝试 {max_attempts} 个 URL")
-                return None
+            logger.warning(f"背景图下载失败: 已尝试 {max_attempts} 个 URL")
+            return None
 
         except Exception as e:
             logger.error(f"获取背景图片时出错: {e}")
@@ -1017,6 +3716,9 @@ class JrysPlugin(Star):
         color: Tuple[int, int, int] = (255, 255, 255),
         max_width: int = 800,
         gradients: bool = False,
+        rng: Optional[random.Random] = None,
+        lines: Optional[List[str]] = None,
+        draw: Optional[ImageDraw.ImageDraw] = None,
     ) -> Image.Image:
         """
         在图片上绘制文字
@@ -1029,18 +3731,23 @@ class JrysPlugin(Star):
             font (ImageFont): 字体对象,如果为None则使用默认字体
             max_width (int): 文字的最大宽度,默认为800
             gradients (bool): 是否使用渐变色填充文字，默认为False
+            rng (Random): 渐变色使用的随机数生成器，默认使用全局随机
+            lines (list): 预先换行好的文本行，提供时跳过自动换行
+            draw (ImageDraw): 复用的绘图对象，同一画布连续绘制时传入
         """
 
         try:
-            draw = ImageDraw.Draw(img)
+            if draw is None:
+                draw = ImageDraw.Draw(img)
 
             # 自动换行处理
-            lines = self.wrap_text(
-                text=text,
-                font=font,
-                draw=draw,
-                max_width=TEXT_WRAP_WIDTH,
-            )  # 将文字按最大宽度进行换行
+            if lines is None:
+                lines = self.wrap_text(
+                    text=text,
+                    font=font,
+                    draw=draw,
+                    max_width=self.layout.wrap_width,
+                )  # 将文字按最大宽度进行换行
 
             # 获取图片的宽高
             img_width, img_height = img.size
@@ -1060,7 +3767,7 @@ class JrysPlugin(Star):
                 elif position == "left":
 
                     def x_func(line):
-                        return LEFT_PADDING  # 固定左侧留白
+                        return self.layout.left_padding  # 固定左侧留白
 
                     def offset_x_func(line):
                         return 0
@@ -1091,11 +3798,17 @@ class JrysPlugin(Star):
                     offset_x = offset_x_func(line)
                     for char in line:
                         #
-                        colors = self.get_light_color()
+                        colors = self.get_light_color(rng)
                         gradient_char = self.create_gradients_image(char, font, colors)
-                        img.paste(
-                            gradient_char, (base_x + offset_x, text_y), gradient_char
-                        )
+                        if img.mode == "RGBA":
+                            # 透明画布上用 alpha 合成，保证缓存图层的透明度正确
+                            img.alpha_composite(
+                                gradient_char, (base_x + offset_x, text_y)
+                            )
+                        else:
+                            img.paste(
+                                gradient_char, (base_x + offset_x, text_y), gradient_char
+                            )
 
                         bbox = font.getbbox(char)
                         char_width = bbox[2] - bbox[0]  # 获取字符宽度
@@ -1125,38 +3838,41 @@ class JrysPlugin(Star):
 
         参数：
 
-            width (int): 裁剪宽度，默认为 1080 像素。
-            height (int): 裁剪高度，默认为 1920 像素。
+            width (int): 裁剪宽度，默认为渲染排版的宽度（img_width x render_scale）。
+            height (int): 裁剪高度，默认为渲染排版的高度（img_height x render_scale）。
 
         返回：
             Image.Image: 裁剪后的图片对象，如果发生错误则返回 None。
         """
-        width = width if width is not None else self.image_width
-        height = height if height is not None else self.image_height
+        width = width if width is not None else self.layout.width
+        height = height if height is not None else self.layout.height
         try:
-            img = Image.open(image_path).convert("RGBA")
+            img = Image.open(image_path)
             img_width, img_height = img.size
+            new_size = None
 
             # 如果图片尺寸小于目标尺寸，则先放大
             if img_width < width or img_height < height:
                 scale_x = width / img_width
                 scale_y = height / img_height
                 scale = max(scale_x, scale_y)  # 保持比例，选择较大的缩放倍数
-                new_width = int(img_width * scale)
-                new_height = int(img_height * scale)
-                img = img.resize((new_width, new_height), Image.LANCZOS)  #
+                new_size = (int(img_width * scale), int(img_height * scale))
 
             # 如果图片尺寸远大于目标尺寸
 
             else:
-                max_scale = 1.8  # 防止图片太大浪费资源
+                max_scale = CROP_MAX_SCALE  # 防止图片太大浪费资源
                 if img_width > width * max_scale or img_height > height * max_scale:
                     scale_x = (width * max_scale) / img_width
                     scale_y = (height * max_scale) / img_height
                     scale = min(scale_x, scale_y)
-                    new_width = int(img_width * scale)
-                    new_height = int(img_height * scale)
-                    img = img.resize((new_width, new_height), Image.LANCZOS)
+                    new_size = (int(img_width * scale), int(img_height * scale))
+
+            # 画布不需要透明通道，直接解码为 RGB（已是 RGB 时不再复制）
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            if new_size is not None and img.size != new_size:
+                img = img.resize(new_size, Image.LANCZOS)
 
             # 重新获取放大后的图片尺寸
             img_width, img_height = img.size
@@ -1166,8 +3882,6 @@ class JrysPlugin(Star):
             right = (img_width + width) / 2
             bottom = (img_height + height) / 2
 
-            # 创建半透明图层
-
             cropped_img = img.crop((left, top, right, bottom))
 
             return cropped_img
@@ -1188,36 +3902,43 @@ class JrysPlugin(Star):
         radius: int = 50,
     ) -> Image.Image:
         """
-        在图片上添加一个半透明图层
+        在图片上添加一个半透明图层（直接修改并返回传入的图片，不创建新图像）
+        调用方需要保留原图时（例如缓存的背景图）应先 copy() 再传入。
 
         参数：
-            base_img (Image): 背景图像（RGBA 格式）
-            text (str): 要绘制的文字内容
+            base_img (Image): 背景图像（RGB 格式，会被原地修改）
             box_width (int): 半透明框的宽度
             box_height (int): 半透明框的高度
             position (tuple): 半透明框的位置
             layer_color (tuple): 半透明层颜色，RGBA 格式
             radius (int): 圆角半径
         返回：
-            合成后的 Image 对象
+            base_img 本身（已绘制半透明图层）
         """
         try:
             x1, y1 = position
-            x2 = x1 + box_width
-            y2 = y1 + box_height
-
-            # 创建半透明图层
-            overlay = Image.new("RGBA", base_img.size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(overlay)
-
-            draw.rounded_rectangle((x1, y1, x2, y2), radius=radius, fill=layer_color)
-
-            return Image.alpha_composite(base_img, overlay)
+            # 只处理面板覆盖的区域：以圆角矩形蒙版把颜色直接混合到原图上
+            mask = self._panel_mask(box_width, box_height, radius, layer_color[3])
+            base_img.paste(layer_color[:3], (x1, y1, x1 + mask.width, y1 + mask.height), mask)
+            return base_img
 
         except Exception as e:
             logger.error(f"添加半透明图层时出错: {e}")
             return base_img
 
+    def _panel_mask(self, box_width: int, box_height: int, radius: int, alpha: int) -> Image.Image:
+        """半透明面板的圆角蒙版（同样尺寸只绘制一次）"""
+        key = (box_width, box_height, radius, alpha)
+        mask = self._panel_masks.get(key)
+        if mask is None:
+            # 与 rounded_rectangle((x1, y1, x2, y2)) 一致，右下边界包含在内
+            mask = Image.new("L", (box_width + 1, box_height + 1), 0)
+            ImageDraw.Draw(mask).rounded_rectangle(
+                (0, 0, box_width, box_height), radius=radius, fill=alpha
+            )
+            self._panel_masks[key] = mask
+        return mask
+
     def wrap_text(
         self,
         text: str,
@@ -1238,8 +3959,8 @@ class JrysPlugin(Star):
         """
         try:
             if draw is None:
-                img = Image.new("RGB", (self.image_width, self.image_height))
-                draw = ImageDraw.Draw(img)
+                # 只用于测量文字宽度，不需要整张画布
+                draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
 
             lines: List[str] = []
             current_line = ""
@@ -1333,9 +4054,14 @@ class JrysPlugin(Star):
             draw.text((0, 0), char, font=font, fill=(255, 255, 255))
             return img
 
-    def get_light_color(self) -> List[Tuple[int, int, int]]:
+    def get_light_color(
+        self, rng: Optional[random.Random] = None
+    ) -> List[Tuple[int, int, int]]:
         """获取浅色调颜色列表用于渐变
 
+        Args:
+            rng: 随机数生成器，默认使用全局随机
+
         Returns:
             浅色调颜色列表
         """
@@ -1350,7 +4076,7 @@ class JrysPlugin(Star):
             (245, 245, 220),  # 浅米色
             (230, 230, 250),  # 浅薰衣草色
         ]
-        return random.choices(light_colors, k=4)  # 随机选4个颜色进行渐变
+        return (rng or random).choices(light_colors, k=4)  # 随机选4个颜色进行渐变
 
     async def get_avatar_img(self, user_id: str) -> Optional[str]:
         """
@@ -1363,73 +4089,179 @@ class JrysPlugin(Star):
             str: 头像的路径
         """
         try:
-            self._ensure_storage_dirs()
-            avatar_path = os.path.join(self.avatar_dir, f"{user_id}.jpg")
-            # 检查头像是否存在
-            if await aiofiles.os.path.exists(avatar_path):
-
-                def _file_stat(path):
-                    try:
-                        st = os.stat(path)
-                        return st.st_mtime
-                    except FileNotFoundError:
-                        return None
-
-                file_mtime = await asyncio.to_thread(_file_stat, avatar_path)
-                file_age = datetime.now().timestamp() - file_mtime
+            # 检查头像是否存在（查内存索引，不访问文件系统）
+            index = await self._load_avatar_index()
+            entry = index.get(user_id)
+            if entry is not None:
                 if (
-                    file_age < self.avatar_cache_expiration
+                    time.time() - entry.mtime < self.avatar_cache_expiration
                 ):  # 默认如果头像文件小于一天，则不下载
-                    return avatar_path
-
-            url = f"http://q.qlogo.cn/g?b=qq&nk={user_id}&s=640"
+                    self._count_cache("avatar", "hits")
+                    return entry.path
+
+                # 索引中已过期：共享缓存目录下可能已被其它实例刷新，以文件为准
+                fresh = await asyncio.to_thread(self._stat_avatar, entry.path)
+                if fresh is not None and time.time() - fresh.mtime < self.avatar_cache_expiration:
+                    index[user_id] = fresh
+                    self._count_cache("avatar", "hits")
+                    return fresh.path
+
+                # 已过期，需要重新下载
+                self._count_cache("avatar", "stale")
+            else:
+                self._count_cache("avatar", "misses")
 
-            ok = await self._download_to_path(url, Path(avatar_path), label="头像")
-            if ok:
-                return avatar_path
-            return None
+            entry = await self._download_avatar(user_id)
+            return entry.path if entry is not None else None
 
         except Exception as e:
             logger.error(f"获取用户头像失败: {e}")
             return None
 
-    def draw_avatar_img(self, avatar_path: str, img: Image.Image) -> Image.Image:
+    @staticmethod
+    def _stat_avatar(path: str) -> Optional[AvatarEntry]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return AvatarEntry(path, st.st_mtime, st.st_size)
+
+    async def _load_avatar_index(self) -> Dict[str, AvatarEntry]:
+        """头像缓存索引，首次调用时在线程中扫描头像目录"""
+        if self._avatar_index is not None:
+            return self._avatar_index
+
+        await self._ensure_storage_ready()
+        avatar_dir = self.avatar_dir
+
+        def _scan() -> Dict[str, AvatarEntry]:
+            index: Dict[str, AvatarEntry] = {}
+            try:
+                with os.scandir(avatar_dir) as entries:
+                    for entry in entries:
+                        if not entry.name.endswith(".jpg") or not entry.is_file():
+                            continue
+                        st = entry.stat()
+                        index[entry.name[: -len(".jpg")]] = AvatarEntry(
+                            entry.path, st.st_mtime, st.st_size
+                        )
+            except FileNotFoundError:
+                pass
+            return index
+
+        index = await asyncio.to_thread(_scan)
+        if self._avatar_index is None:
+            self._avatar_index = index
+            logger.info(f"头像缓存索引加载完成: {len(index)} 个")
+        return self._avatar_index
+
+    async def _download_avatar(self, user_id: str, retries: int = 1) -> Optional[AvatarEntry]:
+        """下载用户头像并更新索引，失败时返回 None"""
+        index = await self._load_avatar_index()
+        avatar_path = os.path.join(self.avatar_dir, f"{user_id}.jpg")
+        ok = await self._download_to_path(
+            AVATAR_URL.format(user_id=user_id),
+            Path(avatar_path),
+            label="头像",
+            retries=retries,
+            cache="avatar",
+        )
+        if not ok:
+            return None
+
+        entry = await asyncio.to_thread(self._stat_avatar, avatar_path)
+        if entry is not None:
+            index[user_id] = entry
+        return entry
+
+    def draw_avatar_img(self, avatar_path: Optional[str], img: Image.Image) -> Image.Image:
         """
         在图片上绘制用户头像
         1. 获取用户头像
         2. 将头像裁剪为圆形
         3. 将头像绘制到图片上
         Args:
-            avatar_path (str): 头像的路径
+            avatar_path (str): 头像的路径，为空时（头像获取失败）不绘制
             img (Image): 要绘制的图片
         Returns:
             Image: 绘制了头像的图片
         """
+        if not avatar_path:
+            return img
         try:
-            avatar = Image.open(avatar_path).convert("RGBA")
-            avatar = avatar.resize(self.avatar_size, Image.LANCZOS)
+            avatar_size = self.layout.avatar_size
+            with Image.open(avatar_path) as source:
+                avatar = source.convert("RGB").resize(avatar_size, Image.LANCZOS)
 
-            # 创建一个与头像尺寸相同的透明蒙版
-            mask = Image.new("L", avatar.size, 0)
-            mask_draw = ImageDraw.Draw(mask)
-
-            # 绘制一个白色的圆形，作为不透明区域
-            mask_draw.ellipse((0, 0, avatar.size[0], avatar.size[1]), fill=255)
+            # 圆形蒙版（白色圆形为不透明区域），同样尺寸只绘制一次
+            mask = self._avatar_masks.get(avatar_size)
+            if mask is None:
+                mask = Image.new("L", avatar_size, 0)
+                ImageDraw.Draw(mask).ellipse((0, 0, avatar_size[0], avatar_size[1]), fill=255)
+                self._avatar_masks[avatar_size] = mask
 
-            # 将蒙版应用到头像上
-            avatar.putalpha(mask)
-
-            # 将头像粘贴到图片上
-            img.paste(avatar, self.avatar_position, avatar)
+            # 将头像按圆形蒙版粘贴到图片上
+            img.paste(avatar, self.layout.avatar_position, mask)
 
             return img
         except Exception as e:
             logger.error(f"绘制头像时出错: {e}")
+            if isinstance(e, OSError):
+                # 头像文件被删除或损坏：移出索引，下次请求重新下载
+                self._forget_avatar(avatar_path)
             # 如果出错，返回原始图片
             return img
 
+    def _forget_avatar(self, avatar_path: str) -> None:
+        index = self._avatar_index
+        if index is None:
+            return
+        user_id = Path(avatar_path).stem
+        entry = index.get(user_id)
+        if entry is not None and entry.path == avatar_path:
+            index.pop(user_id, None)
+            self._count_cache("avatar", "evictions")
+
     async def terminate(self):
         """插件终止时的清理工作"""
+        if self._cache_stats_task and not self._cache_stats_task.done():
+            self._cache_stats_task.cancel()
+            try:
+                await self._cache_stats_task
+            except asyncio.CancelledError:
+                pass
+        await self._publish_cache_stats()
+        await self._stop_loop_lag_monitor()
+        await self._flush_background_index()
+        if self._profile_timeout_task and not self._profile_timeout_task.done():
+            self._profile_timeout_task.cancel()
+        if self._profile_session is not None:
+            self._profile_session.close()
+            self._profile_session = None
+        if self._storage_task and not self._storage_task.done():
+            self._storage_task.cancel()
+        if self._hot_reload_task and not self._hot_reload_task.done():
+            self._hot_reload_task.cancel()
+        if self._last_image_sweep_task and not self._last_image_sweep_task.done():
+            self._last_image_sweep_task.cancel()
+        if self._janitor_task and not self._janitor_task.done():
+            self._janitor_task.cancel()
+        if self._avatar_warmup_task and not self._avatar_warmup_task.done():
+            self._avatar_warmup_task.cancel()
+
+        if self._text_sprite_task and not self._text_sprite_task.done():
+            self._text_sprite_task.cancel()
+
+        if self._corpus_layout_task and not self._corpus_layout_task.done():
+            self._corpus_layout_task.cancel()
+        try:
+            await self._flush_corpus_layout()
+        except Exception as e:
+            logger.warning(f"保存运势排版缓存失败: {e}")
+
+        if self._font_subset_task and not self._font_subset_task.done():
+            self._font_subset_task.cancel()
+
         if self._precache_task and not self._precache_task.done():
             self._precache_task.cancel()
             try:
@@ -1439,8 +4271,9 @@ class JrysPlugin(Star):
             except Exception as e:
                 logger.warning(f"预缓存任务清理失败: {e}")
 
-        if self._session:
+        if self._session and not self._session.closed:
             await self._session.close()
             logger.info("HTTP会话已关闭")
+        self._session = None
 
         logger.info("今日运势插件已终止")
@@ -0,0 +1,148 @@
+"""
+渲染基准测试：统计单次渲染耗时与内存分配峰值
+
+Python 对象的分配由 tracemalloc 统计；Pillow 的像素缓冲区在 C 层分配，tracemalloc 看不到，
+由 ImageMemoryTracker 按每张图片的尺寸估算（分配次数、累计字节数、同时存活的峰值）。
+
+用法：
+    python tools/bench_render.py [-n 20] [--plugin 其它版本的main.py] [key=value ...]
+
+key=value 为插件配置，例如 render_scale=0.5 text_sprite_cache=true。
+--plugin 可指定旧版本的 main.py（例如 git show HEAD~1:main.py > /tmp/old_main.py），
+用同一组输入对比优化前后的结果。
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import weakref
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import load_plugin_module, make_fixture_images, make_plugin  # noqa: E402
+from PIL import Image  # noqa: E402
+
+
+class ImageMemoryTracker:
+    """统计 Pillow 图像缓冲区：替换 Image.im 的 setter，记录每次分配并在图片回收时扣除"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.live = 0
+        self.peak = 0
+        self._sizes = {}
+        self._property = Image.Image.__dict__["im"]
+
+    @staticmethod
+    def _nbytes(core) -> int:
+        if core is None:
+            return 0
+        width, height = core.size
+        # Pillow 中单通道图像每像素 1 字节，其余模式（含 RGB）每像素 4 字节
+        return width * height * (1 if core.mode in ("1", "L", "P") else 4)
+
+    def _release(self, key: int) -> None:
+        self.live -= self._sizes.pop(key, 0)
+
+    def _assign(self, img, core) -> None:
+        self._property.fset(img, core)
+        key = id(img)
+        old = self._sizes.get(key)
+        if old is None:
+            weakref.finalize(img, self._release, key)
+        else:
+            self.live -= old
+        nbytes = self._nbytes(core)
+        self._sizes[key] = nbytes
+        self.live += nbytes
+        self.total += nbytes
+        self.count += 1
+        self.peak = max(self.peak, self.live)
+
+    def reset(self) -> None:
+        self.count = self.total = 0
+        self.peak = self.live
+
+    def __enter__(self):
+        Image.Image.im = property(self._property.fget, self._assign)
+        return self
+
+    def __exit__(self, *exc):
+        Image.Image.im = self._property
+
+
+def parse_value(value: str):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+async def run(args) -> dict:
+    work_dir = Path(tempfile.mkdtemp(prefix="jrys_bench_"))
+    module = load_plugin_module(args.plugin, data_dir=str(work_dir / "data"))
+    config = dict(item.split("=", 1) for item in args.config)
+    plugin = make_plugin(module, **{k: parse_value(v) for k, v in config.items()})
+    background, avatar = make_fixture_images(work_dir / "fixtures")
+
+    await plugin.initialize()
+    corpus = await plugin._load_corpus()
+
+    # 预热：字体加载、条目排版、各类缓存不计入结果
+    for _ in range(args.warmup):
+        os.remove(plugin._generate_image_sync("10000", avatar, background, corpus))
+
+    timings, peaks, image_peaks, image_counts, image_totals = [], [], [], [], []
+    with ImageMemoryTracker() as images:
+        for i in range(args.n):
+            user_id = str(10000 + i)
+            gc.collect()
+            images.reset()
+            baseline = images.live
+            tracemalloc.start()
+            start = time.perf_counter()
+            out = plugin._generate_image_sync(user_id, avatar, background, corpus)
+            timings.append(time.perf_counter() - start)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peaks.append(peak)
+            image_peaks.append(images.peak - baseline)
+            image_counts.append(images.count)
+            image_totals.append(images.total)
+            os.remove(out)
+
+    await plugin.terminate()
+    return {
+        "renders": args.n,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p50_ms": statistics.median(timings) * 1000,
+        "max_ms": max(timings) * 1000,
+        "py_peak_mb": max(peaks) / 1024 / 1024,
+        "image_peak_mb": max(image_peaks) / 1024 / 1024,
+        "image_alloc_mb": statistics.mean(image_totals) / 1024 / 1024,
+        "image_allocs": statistics.mean(image_counts),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", type=int, default=20, help="计时渲染次数")
+    parser.add_argument("--warmup", type=int, default=2, help="预热渲染次数")
+    parser.add_argument("--plugin", help="要测试的 main.py，默认为当前插件")
+    parser.add_argument("config", nargs="*", help="插件配置 key=value")
+    result = asyncio.run(run(parser.parse_args()))
+    for key, value in result.items():
+        print(f"{key:>20}: {value:.2f}" if isinstance(value, float) else f"{key:>20}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+渲染回归测试：用固定的运势、日期与合成背景图/头像渲染海报，与 golden 图片比对
+
+用法：
+    python tools/golden_render.py            # 比对，任一用例低于阈值时返回非 0
+    python tools/golden_render.py --update   # 重新生成 golden 图片（确认改动符合预期后再提交）
+    python tools/golden_render.py --out DIR  # 另外输出实际渲染结果与差异图，便于查看
+
+渐变色由用户 ID 与日期决定，日期固定后每次渲染结果一致。不同平台的 FreeType / libjpeg
+版本会带来细微差异，因此按 PSNR 判断而不是逐像素比较。
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+from hashlib import sha256
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import load_plugin_module, make_fixture_images, make_plugin  # noqa: E402
+from PIL import Image, ImageChops, ImageStat  # noqa: E402
+
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden"
+FIXTURE_DIR = GOLDEN_DIR / "fixtures"
+FIXED_NOW = datetime(2024, 2, 10, 9, 30, 0)
+USER_ID = "10001"
+MIN_PSNR = 42.0  # dB，面板透明度或文字位置的细微变化都会低于该值
+
+# 用例：(名称, 使用的运势分组, 插件配置)
+CASES = [
+    ("default", "84", {}),
+    ("long_text_half", "14", {"render_scale": 0.5}),
+    ("tall_half", "84", {"render_scale": 0.5, "img_height": 2400}),
+    (
+        "layer_cache_half",
+        "84",
+        {"render_scale": 0.5, "text_sprite_cache": True, "date_layer_cache": True},
+    ),
+]
+
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls.combine(FIXED_NOW.date(), FIXED_NOW.time(), tzinfo=tz)
+
+
+def psnr(actual: Image.Image, expected: Image.Image) -> float:
+    if actual.size != expected.size:
+        return 0.0
+    diff = ImageChops.difference(actual.convert("RGB"), expected.convert("RGB"))
+    mse = sum(v * v for v in ImageStat.Stat(diff).rms) / 3
+    return math.inf if mse == 0 else 10 * math.log10(255 * 255 / mse)
+
+
+async def render_case(module, group: str, config: dict) -> bytes:
+    """渲染一个用例，返回插件输出的 JPEG 数据"""
+    plugin = make_plugin(module, **config)
+    await plugin.initialize()
+    try:
+        fixture = json.loads((FIXTURE_DIR / "jrys.json").read_text(encoding="utf-8"))
+        data = {group: fixture[group]}
+        source = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        corpus = plugin._parse_corpus(data, sha256(source).hexdigest())  # 渲染时按需排版
+        out = plugin._generate_image_sync(
+            USER_ID,
+            str(FIXTURE_DIR / "avatar.jpg"),
+            str(FIXTURE_DIR / "background.jpg"),
+            corpus,
+        )
+        if out is None:
+            raise RuntimeError("渲染失败，详见日志")
+        output = Path(out).read_bytes()
+        os.remove(out)
+        return output
+    finally:
+        await plugin.terminate()
+
+
+async def run(args) -> int:
+    work_dir = Path(tempfile.mkdtemp(prefix="jrys_golden_"))
+    module = load_plugin_module(data_dir=str(work_dir / "data"))
+    module.datetime = FixedDatetime
+    make_fixture_images(FIXTURE_DIR)
+    if args.out:
+        Path(args.out).mkdir(parents=True, exist_ok=True)
+
+    failed = 0
+    for name, group, config in CASES:
+        if args.case and name not in args.case:
+            continue
+        output = await render_case(module, group, config)
+        golden_path = GOLDEN_DIR / f"{name}.jpg"
+
+        if args.update:
+            golden_path.write_bytes(output)
+            print(f"{name:>20}: 已更新 {golden_path.name} ({len(output) / 1024:.0f}KB)")
+            continue
+
+        if not golden_path.exists():
+            print(f"{name:>20}: 缺少 golden 图片，请先运行 --update")
+            failed += 1
+            continue
+
+        actual = Image.open(io.BytesIO(output))
+        with Image.open(golden_path) as expected:
+            score = psnr(actual, expected)
+            ok = score >= args.min_psnr
+            if args.out:
+                (Path(args.out) / f"{name}.jpg").write_bytes(output)
+                if actual.size == expected.size:
+                    diff = ImageChops.difference(actual.convert("RGB"), expected.convert("RGB"))
+                    diff.point(lambda v: min(255, v * 8)).save(Path(args.out) / f"{name}_diff.png")
+        failed += not ok
+        print(f"{name:>20}: {'通过' if ok else '失败'} PSNR={score:.2f}dB")
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--update", action="store_true", help="重新生成 golden 图片")
+    parser.add_argument("--out", help="输出实际渲染结果与差异图的目录")
+    parser.add_argument("--min-psnr", type=float, default=MIN_PSNR, help="通过阈值（dB）")
+    parser.add_argument("case", nargs="*", help="只运行指定用例")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
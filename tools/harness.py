@@ -0,0 +1,131 @@
+"""
+离线运行插件的辅助模块（基准测试 / 回归测试共用）
+
+不依赖 AstrBot：导入 main.py 前注入最小化的 astrbot 桩模块，
+插件数据目录指向临时目录，不会写入真实的 AstrBot 数据目录。
+"""
+
+import importlib.util
+import logging
+import sys
+import tempfile
+import types
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+
+
+class StubConfig(dict):
+    """AstrBotConfig 的替身：插件只用到 dict 接口"""
+
+
+class StubContext:
+    """Context 的替身：插件构造时只保存它"""
+
+
+class StubStar:
+    def __init__(self, context):
+        self.context = context
+        self.kv_data = {}
+
+    async def put_kv_data(self, key, value):
+        self.kv_data[key] = value
+
+    async def get_kv_data(self, key, default=None):
+        return self.kv_data.get(key, default)
+
+
+class _StubFilter:
+    """filter.command / filter.permission_type 等装饰器直接返回原函数"""
+
+    class EventMessageType:
+        ALL = "all"
+
+    class PermissionType:
+        ADMIN = "admin"
+
+    def __getattr__(self, name):
+        def decorator_factory(*args, **kwargs):
+            return lambda func: func
+
+        return decorator_factory
+
+
+def install_astrbot_stubs(data_dir: str) -> None:
+    """注入 astrbot 桩模块；已安装真实 AstrBot 时也会被替换，保证结果可复现"""
+    logging.basicConfig(level=logging.WARNING)
+
+    def module(name: str, **attrs) -> types.ModuleType:
+        mod = types.ModuleType(name)
+        mod.__dict__.update(attrs)
+        sys.modules[name] = mod
+        return mod
+
+    module("astrbot")
+    module(
+        "astrbot.api",
+        logger=logging.getLogger("astrbot"),
+        AstrBotConfig=StubConfig,
+    )
+    module(
+        "astrbot.api.event",
+        filter=_StubFilter(),
+        AstrMessageEvent=type("AstrMessageEvent", (), {}),
+    )
+    module(
+        "astrbot.api.star",
+        Context=StubContext,
+        Star=StubStar,
+        register=lambda *args, **kwargs: (lambda cls: cls),
+    )
+    module("astrbot.core")
+    module("astrbot.core.utils")
+    module(
+        "astrbot.core.utils.astrbot_path",
+        get_astrbot_data_path=lambda: data_dir,
+    )
+
+
+def load_plugin_module(plugin_file: Optional[str] = None, data_dir: Optional[str] = None):
+    """导入插件 main.py（可指定其它版本的 main.py 做对比）"""
+    data_dir = data_dir or tempfile.mkdtemp(prefix="jrys_data_")
+    install_astrbot_stubs(data_dir)
+    plugin_file = plugin_file or str(PLUGIN_DIR / "main.py")
+    if Path(plugin_file).resolve().parent != PLUGIN_DIR:
+        # 插件按 main.py 所在目录查找字体与语料，其它版本放进临时目录并链接这些资源
+        plugin_dir = Path(tempfile.mkdtemp(prefix="jrys_plugin_"))
+        for name in ("font", "backgroundFolder", "jrys.json"):
+            (plugin_dir / name).symlink_to(PLUGIN_DIR / name)
+        (plugin_dir / "main.py").write_bytes(Path(plugin_file).read_bytes())
+        plugin_file = str(plugin_dir / "main.py")
+    spec = importlib.util.spec_from_file_location("jrys_main", plugin_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_plugin(module, **config):
+    """按给定配置构造插件实例"""
+    return module.JrysPlugin(StubContext(), StubConfig(config))
+
+
+def make_fixture_images(out_dir: Path, size=(1500, 2500)) -> tuple:
+    """生成确定性的合成背景图与头像（与平台、字体无关）"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    background = out_dir / "background.jpg"
+    avatar = out_dir / "avatar.jpg"
+    if not background.exists():
+        radial = Image.radial_gradient("L").resize(size)
+        linear = Image.linear_gradient("L").resize(size)
+        Image.merge("RGB", (radial, linear, linear.transpose(Image.FLIP_LEFT_RIGHT))).save(
+            background, quality=90
+        )
+    if not avatar.exists():
+        linear = Image.linear_gradient("L").resize((640, 640))
+        Image.merge("RGB", (linear, linear.transpose(Image.ROTATE_90), linear)).save(
+            avatar, quality=90
+        )
+    return str(background), str(avatar)
@@ -0,0 +1,250 @@
+"""
+并发压测：模拟大量用户同时发送“今日运势”
+
+用法：
+    python tools/load_test.py [--users 200] [--latency-ms 80] [--error-rate 0.05] [key=value ...]
+
+背景图与头像由本地 aiohttp 服务（独立进程）提供，可配置延迟、错误率与图片大小，
+整个过程不访问外网。插件通过桩模块加载（见 harness.py），key=value 为插件配置。
+输出吞吐量、p50/p99 延迟、峰值 RSS、事件循环延迟与错误分类。
+插件刚加载完就开始压测：第一轮包含冷启动（运势条目首次排版等），
+--rounds 大于 1 时按轮输出延迟，可以对比冷启动与稳定状态。
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import load_plugin_module, make_plugin  # noqa: E402
+from PIL import Image  # noqa: E402
+
+LAG_SAMPLE_INTERVAL = 0.01
+
+
+class FakeEvent:
+    """AstrMessageEvent 的替身：只实现插件用到的方法，结果以 (类型, 内容) 返回"""
+
+    def __init__(self, user_id: str, message: str, group_id: str = "10000"):
+        self.message_str = message
+        self._user_id = user_id
+        self._group_id = group_id
+
+    def get_sender_id(self) -> str:
+        return self._user_id
+
+    def get_sender_name(self) -> str:
+        return f"用户{self._user_id}"
+
+    def get_group_id(self) -> str:
+        return self._group_id
+
+    def get_platform_name(self) -> str:
+        return "load_test"
+
+    def plain_result(self, text: str):
+        return ("plain", text)
+
+    def image_result(self, path: str):
+        return ("image", path)
+
+
+def parse_value(value: str):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def make_payload(index: int, size: tuple, payload_kb: int) -> bytes:
+    """生成 JPEG，不足 payload_kb 时在文件末尾补齐（解码器会忽略 EOI 之后的数据）"""
+    rng = random.Random(index)
+    color = tuple(rng.randrange(256) for _ in range(3))
+    gradient = Image.radial_gradient("L").resize(size)
+    img = Image.merge("RGB", [gradient.point(lambda v, c=c: (v + c) % 256) for c in color])
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=85)
+    data = buf.getvalue()
+    return data + b"\0" * max(0, payload_kb * 1024 - len(data))
+
+
+def run_cdn(port_queue, args) -> None:
+    """本地 CDN 替身（在独立进程中运行，不占用插件的事件循环）"""
+    from aiohttp import web
+
+    backgrounds = [make_payload(i, (1200, 2000), args.payload_kb) for i in range(args.backgrounds)]
+    avatar = make_payload(0, (640, 640), args.avatar_kb)
+    rng = random.Random(0)
+
+    async def respond(body: bytes):
+        delay = args.latency_ms / 1000 * rng.uniform(0.5, 1.5)
+        await asyncio.sleep(delay)
+        if rng.random() < args.error_rate:
+            return web.Response(status=503, text="unavailable")
+        return web.Response(body=body, content_type="image/jpeg")
+
+    async def background(request):
+        return await respond(backgrounds[int(request.match_info["n"]) % len(backgrounds)])
+
+    async def avatar_handler(request):
+        return await respond(avatar)
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/bg/{n}.jpg", background)
+        app.router.add_get("/avatar", avatar_handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port_queue.put(site._server.sockets[0].getsockname()[1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+async def measure_loop_lag(samples: list, stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+        samples.append(max(0.0, loop.time() - start - LAG_SAMPLE_INTERVAL))
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run(args, port: int) -> dict:
+    work_dir = Path(tempfile.mkdtemp(prefix="jrys_load_"))
+    module = load_plugin_module(data_dir=str(work_dir / "data"))
+    module.AVATAR_URL = f"http://127.0.0.1:{port}/avatar?nk={{user_id}}"
+
+    background_dir = work_dir / "backgroundFolder"
+    background_dir.mkdir()
+    (background_dir / "load_test.txt").write_text(
+        "\n".join(f"http://127.0.0.1:{port}/bg/{i}.jpg" for i in range(args.backgrounds)),
+        encoding="utf-8",
+    )
+
+    config = {key: parse_value(value) for key, value in (c.split("=", 1) for c in args.config)}
+    plugin = make_plugin(module, **config)
+    plugin.background_dir = str(background_dir)
+    init_start = time.perf_counter()
+    await plugin.initialize()
+    init_elapsed = time.perf_counter() - init_start
+
+    latencies, outcomes = [], Counter()
+    round_latencies: list = []
+    lag_samples: list = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(lag_samples, stop))
+
+    async def one_user(user_id: str) -> None:
+        event = FakeEvent(user_id, args.message)
+        start = time.perf_counter()
+        try:
+            results = [result async for result in plugin.jrys_keyword_handler(event)]
+        except Exception as e:
+            outcomes[f"exception: {type(e).__name__}"] += 1
+            return
+        latencies.append(time.perf_counter() - start)
+        round_latencies[-1].append(latencies[-1])
+        kinds = [kind for kind, _ in results]
+        if "image" in kinds:
+            outcomes["ok"] += 1
+            for kind, path in results:
+                if kind == "image" and os.path.exists(path):
+                    os.remove(path)
+        elif results:
+            outcomes[f"reply: {results[-1][1]}"] += 1
+        else:
+            outcomes["no reply"] += 1
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for round_index in range(args.rounds):
+        users = [str(100000 + round_index * args.users + i) for i in range(args.users)]
+        round_latencies.append([])
+        await asyncio.gather(*(one_user(user_id) for user_id in users))
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    stop.set()
+    await lag_task
+    stats = plugin._cache_stats_snapshot()
+    await plugin.terminate()
+
+    total = args.users * args.rounds
+    return {
+        "requests": total,
+        "elapsed_s": elapsed,
+        "throughput_rps": outcomes["ok"] / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies, default=0.0) * 1000,
+        "init_ms": init_elapsed * 1000,
+        "round_p50_ms": [round(percentile(r, 50) * 1000, 1) for r in round_latencies],
+        "round_p99_ms": [round(percentile(r, 99) * 1000, 1) for r in round_latencies],
+        "peak_rss_mb": rss_after / 1024,
+        "rss_growth_mb": (rss_after - rss_before) / 1024,
+        "loop_lag_p99_ms": percentile(lag_samples, 99) * 1000,
+        "loop_lag_max_ms": max(lag_samples, default=0.0) * 1000,
+        "outcomes": dict(outcomes),
+        "http": stats.get("http", {}),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=200, help="每轮同时触发的用户数")
+    parser.add_argument("--rounds", type=int, default=1, help="轮数（每轮使用新的用户）")
+    parser.add_argument("--message", default="今日运势", help="发送的消息（走关键词处理器）")
+    parser.add_argument("--backgrounds", type=int, default=20, help="背景图 URL 数量")
+    parser.add_argument("--latency-ms", type=float, default=80, help="CDN 平均响应延迟")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="CDN 返回 503 的比例")
+    parser.add_argument("--payload-kb", type=int, default=300, help="背景图大小")
+    parser.add_argument("--avatar-kb", type=int, default=40, help="头像大小")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    parser.add_argument("config", nargs="*", help="插件配置 key=value（值按 JSON 解析）")
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    cdn = multiprocessing.Process(target=run_cdn, args=(port_queue, args), daemon=True)
+    cdn.start()
+    try:
+        port = port_queue.get(timeout=30)
+        result = asyncio.run(run(args, port))
+    finally:
+        cdn.terminate()
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    for key, value in result.items():
+        if isinstance(value, dict):
+            print(f"{key:>16}:")
+            for sub_key, sub_value in sorted(value.items(), key=lambda kv: str(kv[0])):
+                print(f"{'':>18}{sub_key}: {sub_value}")
+        elif isinstance(value, float):
+            print(f"{key:>16}: {value:.2f}")
+        else:
+            print(f"{key:>16}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+多进程共享缓存检查：多个插件进程同时使用同一个 shared_cache_dir
+
+用法：
+    python tools/shared_cache_check.py [--processes 4] [--backgrounds 6] [--avatars 12]
+
+背景图与头像由本地 aiohttp 服务（独立进程）提供，每个 URL 返回固定内容并统计请求次数；
+其中一半背景图 URL 与另一个 URL 内容相同（用于检查按内容去重）。
+各插件进程在同一时刻开始，同时下载全部背景图与头像，再同时读取裁剪后的背景图。完成后检查：
+1. background_blobs：文件名等于内容的 sha256、可以完整解码，同一内容只有一份
+2. 背景图缓存条目：内容等于服务端数据，索引（background_index.json）记录的哈希一致
+3. background_normalized：每张原图一份裁剪结果，可以完整解码，与直接裁剪原图的结果逐像素一致
+4. 头像：内容等于服务端数据
+5. 没有残留的 .tmp 文件，每个 URL 只被下载一次（其余进程等待锁后复用下载结果）
+任一检查失败时退出码为 1。--no-lock 关闭跨进程锁，用于确认本检查能发现并发问题（预期出现重复下载）；
+--lockfile 不使用 fcntl，改用 Windows 下的锁文件模式。
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from hashlib import sha256
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from harness import load_plugin_module, make_plugin  # noqa: E402
+from PIL import Image, ImageChops  # noqa: E402
+
+# 背景图大于画布 1.8 倍（CROP_MAX_SCALE），插件会缓存裁剪结果
+BACKGROUND_SIZE = (2200, 3900)
+AVATAR_SIZE = (320, 320)
+CDN_LATENCY = 0.2  # 秒，拉长下载时间，让各进程的下载重叠
+
+
+def make_image(index: int, size: tuple) -> bytes:
+    gradient = Image.radial_gradient("L").resize(size)
+    channels = [gradient.point(lambda v, c=c: (v + c) % 256) for c in (index * 37, index * 71, 90)]
+    buf = io.BytesIO()
+    Image.merge("RGB", channels).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def background_payloads(count: int) -> dict:
+    """{路径: 内容}，后一半 URL 与前一半内容相同"""
+    distinct = (count + 1) // 2
+    bodies = [make_image(i, BACKGROUND_SIZE) for i in range(distinct)]
+    return {f"/bg/{i}.jpg": bodies[i % distinct] for i in range(count)}
+
+
+def avatar_payloads(count: int) -> dict:
+    return {str(10000 + i): make_image(100 + i, AVATAR_SIZE) for i in range(count)}
+
+
+def run_cdn(port_queue, stats_queue, stop_event, args) -> None:
+    """本地 CDN 替身：按路径统计请求次数，结束时把统计放入 stats_queue"""
+    from aiohttp import web
+
+    backgrounds = background_payloads(args.backgrounds)
+    avatars = avatar_payloads(args.avatars)
+    requests = Counter()
+
+    async def background(request):
+        requests[request.path] += 1
+        await asyncio.sleep(CDN_LATENCY)
+        return web.Response(body=backgrounds[request.path], content_type="image/jpeg")
+
+    async def avatar(request):
+        user_id = request.query["nk"]
+        requests[f"/avatar/{user_id}"] += 1
+        await asyncio.sleep(CDN_LATENCY)
+        return web.Response(body=avatars[user_id], content_type="image/jpeg")
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/bg/{name}", background)
+        app.router.add_get("/avatar", avatar)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port_queue.put(site._server.sockets[0].getsockname()[1])
+        while not stop_event.is_set():
+            await asyncio.sleep(0.05)
+        stats_queue.put(dict(requests))
+        await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def run_worker(index: int, port: int, shared_dir: str, barrier, result_queue, args) -> None:
+    """一个插件实例（独立进程，独立的插件数据目录）"""
+
+    async def main():
+        work_dir = Path(tempfile.mkdtemp(prefix=f"jrys_shared_{index}_"))
+        module = load_plugin_module(data_dir=str(work_dir / "data"))
+        if args.lockfile:
+            module.fcntl = None
+        module.AVATAR_URL = f"http://127.0.0.1:{port}/avatar?nk={{user_id}}"
+        plugin = make_plugin(
+            module, shared_cache_dir=shared_dir, hot_reload_interval=0, janitor_interval=0
+        )
+        if args.no_lock:
+            plugin._cache_lock = lambda key: None
+        await plugin.initialize()
+        await plugin._ensure_storage_ready()
+        await plugin._load_background_index()
+
+        urls = [f"http://127.0.0.1:{port}{path}" for path in background_payloads(args.backgrounds)]
+        dests = [plugin._background_cache_path_for_url(url) for url in urls]
+        user_ids = list(avatar_payloads(args.avatars))
+
+        await asyncio.to_thread(barrier.wait)
+        downloads = await asyncio.gather(
+            *(
+                plugin._download_to_path(url, dest, cache="background", dedupe=True)
+                for url, dest in zip(urls, dests)
+            ),
+            *(plugin.get_avatar_img(user_id) for user_id in user_ids),
+        )
+        await plugin._flush_background_index()
+
+        await asyncio.to_thread(barrier.wait)
+        crops = await asyncio.gather(
+            *(asyncio.to_thread(plugin._load_background, str(dest)) for dest in dests)
+        )
+        await plugin.terminate()
+        result_queue.put(
+            {
+                "worker": index,
+                "failed_downloads": sum(1 for ok in downloads if not ok),
+                "failed_crops": sum(1 for crop in crops if crop is None),
+            }
+        )
+
+    asyncio.run(main())
+
+
+def check_shared_dir(shared_dir: Path, args, requests: dict) -> list:
+    """检查共享目录，返回问题列表"""
+    problems = []
+    module = load_plugin_module(data_dir=tempfile.mkdtemp(prefix="jrys_shared_check_"))
+    plugin = make_plugin(module)
+
+    backgrounds = background_payloads(args.backgrounds)
+    distinct = {sha256(body).hexdigest() for body in backgrounds.values()}
+    avatars = avatar_payloads(args.avatars)
+
+    leftovers = [p for p in shared_dir.rglob("*") if p.name.endswith((".tmp", ".stale"))]
+    problems.extend(f"残留临时文件: {p}" for p in leftovers)
+
+    blobs = [p for p in (shared_dir / "background_blobs").iterdir() if p.is_file()]
+    if sorted(p.name for p in blobs) != sorted(distinct):
+        problems.append(f"原件数量 {len(blobs)}，期望 {len(distinct)}（同一内容只保留一份）")
+    for blob in blobs:
+        if sha256(blob.read_bytes()).hexdigest() != blob.name:
+            problems.append(f"原件内容与文件名不一致（写入不完整）: {blob.name}")
+            continue
+        try:
+            with Image.open(blob) as img:
+                img.load()
+        except Exception as e:
+            problems.append(f"原件无法解码: {blob.name}: {e}")
+
+    index = json.loads((shared_dir / "background_index.json").read_text(encoding="utf-8"))
+    cache_dir = shared_dir / "background_images"
+    for path, body in backgrounds.items():
+        digest = sha256(body).hexdigest()
+        entries = [
+            (name, entry) for name, entry in index.items() if entry.get("url", "").endswith(path)
+        ]
+        if len(entries) != 1:
+            problems.append(f"索引中 {path} 的条目数为 {len(entries)}")
+            continue
+        name, entry = entries[0]
+        if entry.get("sha256") != digest:
+            problems.append(f"索引记录的哈希不一致: {path}")
+        cached = cache_dir / name
+        if not cached.exists() or cached.read_bytes() != body:
+            problems.append(f"背景图缓存内容不一致: {path}")
+
+    crops = [p for p in (shared_dir / "background_normalized").iterdir() if p.is_file()]
+    crop_digests = Counter(p.name.split("_", 1)[0] for p in crops)
+    if set(crop_digests) != distinct or any(n != 1 for n in crop_digests.values()):
+        problems.append(f"裁剪结果 {dict(crop_digests)}，期望每张原图一份")
+    for crop in crops:
+        digest = crop.name.split("_", 1)[0]
+        expected = plugin.crop_center(str(shared_dir / "background_blobs" / digest))
+        try:
+            with Image.open(crop) as img:
+                actual = img.convert("RGB")
+        except Exception as e:
+            problems.append(f"裁剪结果无法解码: {crop.name}: {e}")
+            continue
+        if expected is None or ImageChops.difference(actual, expected).getbbox() is not None:
+            problems.append(f"裁剪结果与直接裁剪原图不一致: {crop.name}")
+
+    avatar_dir = shared_dir / "avatars"
+    for user_id, body in avatars.items():
+        cached = next(iter(avatar_dir.glob(f"{user_id}.*")), None)
+        if cached is None or cached.read_bytes() != body:
+            problems.append(f"头像内容不一致: {user_id}")
+
+    repeated = {path: n for path, n in requests.items() if n > 1}
+    if repeated:
+        problems.append(f"重复下载: {repeated}")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4, help="插件进程数")
+    parser.add_argument("--backgrounds", type=int, default=6, help="背景图 URL 数量")
+    parser.add_argument("--avatars", type=int, default=12, help="头像数量")
+    parser.add_argument("--no-lock", action="store_true", help="关闭跨进程锁（对照组）")
+    parser.add_argument("--lockfile", action="store_true", help="使用锁文件模式（同 Windows）")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    shared_dir = Path(tempfile.mkdtemp(prefix="jrys_shared_cache_"))
+    port_queue, stats_queue, result_queue = ctx.Queue(), ctx.Queue(), ctx.Queue()
+    stop_event = ctx.Event()
+    cdn = ctx.Process(target=run_cdn, args=(port_queue, stats_queue, stop_event, args), daemon=True)
+    cdn.start()
+    try:
+        port = port_queue.get(timeout=60)
+        barrier = ctx.Barrier(args.processes)
+        start = time.perf_counter()
+        workers = [
+            ctx.Process(
+                target=run_worker,
+                args=(i, port, str(shared_dir), barrier, result_queue, args),
+            )
+            for i in range(args.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        results = [result_queue.get(timeout=600) for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        stop_event.set()
+        requests = stats_queue.get(timeout=30)
+    finally:
+        stop_event.set()
+        cdn.join(timeout=10)
+        if cdn.is_alive():
+            cdn.terminate()
+
+    problems = [
+        f"进程 {r['worker']}: 下载失败 {r['failed_downloads']} 个, 裁剪失败 {r['failed_crops']} 个"
+        for r in results
+        if r["failed_downloads"] or r["failed_crops"]
+    ]
+    problems.extend(check_shared_dir(shared_dir, args, requests))
+
+    print(f"共享目录: {shared_dir}")
+    print(f"{args.processes} 个进程, 耗时 {elapsed:.1f}s, CDN 请求 {sum(requests.values())} 次")
+    if problems:
+        for problem in problems:
+            print(f"失败: {problem}")
+        return 1
+    print("通过: 没有写入不完整或重复的原件/裁剪结果，每个 URL 只下载一次")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())